@@ -1,9 +1,32 @@
 from .controller import *
-from .interaction import MouseDrag
-from .uiext import *
-from .controlpane import ControlPane
-from .app import Window
-
-from PyQt5.QtGui import QColor
+from .simulation import Simulation
+from .checkpoint import Checkpoint
+from .scheduler import FixedStepScheduler, RateMeter
+from .worker import SimulationWorker, CommandQueue, Snapshot
+from .profiler import Profiler, writeProfile
+from .recording import TrajectoryRecorder, Trajectory
 
+import importlib
 import math
+
+# The GUI, by name and module. Nothing above imports Qt; these are only
+# imported (and Qt with them) when first used, e.g. senesim.Window.
+gui_modules = {
+    'QSliderD': 'uiext',
+    'ProfiledGraphicsView': 'uiext',
+    'Label': 'scene.label',
+    'MouseDrag': 'interaction',
+    'SceneRenderer': 'renderer',
+    'ControlPane': 'controlpane',
+    'Window': 'app',
+}
+
+
+def __getattr__(name):
+    if name not in gui_modules:
+        raise AttributeError(
+            "module 'senesim' has no attribute '{0}'".format(name))
+    value = getattr(importlib.import_module('senesim.' + gui_modules[name]),
+                    name)
+    globals()[name] = value
+    return value
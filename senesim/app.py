@@ -1,4 +1,6 @@
+import itertools
 import sys
+from time import perf_counter
 
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
@@ -6,168 +8,136 @@ from PyQt5.QtGui import *
 
 from Box2D import *
 
-import yaml
-
 from senesim.scene import *
+from senesim.scene.label import Label
 from senesim.config import *
 from senesim import *
+from senesim.uiext import *
+from senesim.controlpane import ControlPane
+from senesim.interaction import MouseDrag
+from senesim.renderer import SceneRenderer
+from senesim.equilibrium import RestDetector
+from senesim.inputs import InputRecorder
 
 
 class Window(QWidget):
 
     def clear(self):
-        for constraint in self.constraints:
-            constraint.cleanup()
-        self.constraints.clear()
-        self.controllers.clear()
-        for body in self.world.bodies:
-            body.userData.cleanup()
+        self.stopWorker()
+        # Before the world goes, as a drag holds a joint in it
+        if self.mouseDrag is not None:
+            self.mouseDrag.cleanup()
+        if self.inputRecorder is not None:
+            self.inputRecorder.close()
+            self.inputRecorder = None
+        self.sim.clear()
         self.mouseDrag = None
         self.mouseJoint = None
         self.mouseItem = None
-        self.controlPane.clear()
+
+    def takeGraphics(self):
+        '''Detaches the scene items of everything built from the current
+        scene, so that objects rebuilt from the same entries can reuse them.
+        Returns lists of items by scene entry.'''
+        pool = {}
+        for entry, obj in self.sim.sceneObjects:
+            items = obj.takeGraphics()
+            if items is not None:
+                pool.setdefault(entry, []).append(items)
+        return pool
 
     def reset(self):
-        '''Generates the world, including all bodies, joints, and elastics.'''
+        '''Regenerates the simulated world, and attaches graphics and controls
+        for everything in it. Scene items and controls are reused for
+        anything that has not changed in the scene file.'''
+        self.stopWorker()
+        pool = self.takeGraphics()
         self.clear()
-
-        # Ground body
-        self.groundBody = Body(self.world, self.scene)
-        self.groundBody.initBox((0, -4), 10, 3, static=True)
-
-        try:
-            print('Loading {0}'.format(self.filePath))
-            with open(self.filePath) as f:
-                parsed = yaml.load(f.read())
-        except IOError as e:
-            print(e)
-
-        bodies = {'_ground': self.groundBody}
-        elastics = {}
-        controllers = {}
-
-        for body in parsed.get('bodies', []):
-            new_body = Body(self.world, self.scene)
-            density = body.get('density', default_density)
-            friction = body.get('friction', default_friction)
-            restitution = body.get('restitution', default_restitution)
-            type = body.get('type', 'box')
-            static = body.get('static', False)
-            color = body.get('color', default_color)
-            label = body.get('label', None)
-
-            mass = body.get('mass', None)
-            inertia = body.get('inertia', None)
-            cog = body.get('cog', None)
-
-            if type == 'box':
-                new_body.initBox(body['pos'], body['width'], body['height'],
-                                 density=density, restitution=restitution,
-                                 friction=friction, static=static,
-                                 label=label, color=color)
-            elif type == 'circle':
-                new_body.initCircle(body['pos'], body['radius'],
-                                    density=density, restitution=restitution,
-                                    friction=friction, static=static,
-                                    label=label, color=color)
+        self.playback = None
+        self.playbackSlider.hide()
+        self.recording = False
+        self.recordButton.setText('Record')
+        self.recordInputsButton.setText('Record Inputs')
+        self.sim.load(self.filePath)
+        self.groundBody = self.sim.groundBody
+        # Static bodies are drawn once, and never synced again
+        self.movingBodies = [body for body in self.sim.bodies
+                             if not body.static]
+
+        if self.batched:
+            # One item draws everything
+            if self.renderer is None:
+                self.renderer = SceneRenderer()
+                self.scene.addItem(self.renderer)
+            self.renderer.forcesVisible = self.forcesVisible
+            self.renderer.attach(self.sim)
+        else:
+            for entry, obj in self.sim.sceneObjects:
+                if pool.get(entry):
+                    obj.adoptGraphics(self.scene, pool[entry].pop())
+                else:
+                    obj.initGraphics(self.scene)
+        for items in pool.values():
+            for item in itertools.chain.from_iterable(items):
+                self.scene.removeItem(item)
+        for constraint in self.sim.constraints:
+            if self.forcesVisible:
+                constraint.showForces()
             else:
-                raise Exception('Unknown body type {0}'.format(type))
-            # Set mass properties, if provided
-            if mass is not None:
-                new_body.body.mass = mass
-            if inertia is not None:
-                new_body.body.inertia = inertia
-            if cog is not None:
-                new_body.body.localCenter = cog
-            # Allows retrieval by ID for joints etc
-            if 'id' in body:
-                bodies[body['id']] = new_body
-
-        for joint in parsed.get('joints', []):
-            type = joint['type']
-            if type == 'revolute':
-                enableLimit = joint.get('enableLimit', False)
-                lowerAngle = joint.get('lowerAngle', 0.0) * b2_pi
-                upperAngle = joint.get('upperAngle', 0.0) * b2_pi
-                collideConnected = joint.get('collideConnected', False)
-                maxMotorTorque = joint.get('maxMotorTorque', 0.0)
-                motorSpeed = joint.get('motorSpeed', 0.0)
-                enableMotor = joint.get('enableMotor', False)
-                referenceAngle = joint.get('referenceAngle', 0.0) * b2_pi
-
-                self.world.CreateRevoluteJoint(
-                    bodyA=bodies[joint['bodyA']].body,
-                    bodyB=bodies[joint['bodyB']].body,
-                    anchor=joint['anchor'],
-                    enableLimit=enableLimit,
-                    lowerAngle=lowerAngle,
-                    upperAngle=upperAngle,
-                    collideConnected=collideConnected,
-                    maxMotorTorque=maxMotorTorque,
-                    motorSpeed=motorSpeed,
-                    enableMotor=enableMotor,
-                    referenceAngle=referenceAngle)
+                constraint.hideForces()
+
+        self.controlPane.setControls(
+            [('load', load.label, load) for load in self.sim.loads] +
+            [('elastic', controller.label, controller)
+             for controller in self.sim.controllers] +
+            [('combo', controller.label, controller)
+             for controller in self.sim.coupledControllers])
+
+        # Scene labels keep their items across resets, moved and retitled
+        labels = self.labels
+        self.labels = []
+        for pos, text in self.sim.labels:
+            scene_pos = QPointF(pos[0]*world_scale, pos[1]*world_scale)
+            if labels:
+                label = labels.pop(0)
+                label.setText(text)
+                label.setPos(scene_pos)
             else:
-                raise Exception('Unknown joint type {0}'.format(type))
-
-        for elastic in parsed.get('elastics', []):
-            new_elastic = Elastic(self.world, self.scene)
-            k = elastic.get('k', 1)
-            damp = elastic.get('damping', 1)
-            new_elastic.initElastic(
-                bodies[elastic['bodyA']].body,
-                bodies[elastic['bodyB']].body,
-                elastic['anchorA'],
-                elastic['anchorB'],
-                k, damping=damp)
-            for contact in elastic.get('contacts', []):
-                new_elastic.addContact(bodies[contact['body']].body,
-                                       contact['point'])
-            self.addConstraint(new_elastic)
-            if 'id' in elastic:
-                elastics[elastic['id']] = new_elastic
-
-        for load in parsed.get('loads', []):
-            body = bodies[load['body']].body
-            anchor = load['anchor']
-            max = load.get('max', 500)
-            new_load = Load(self.world, self.scene, body, anchor, max)
-            label = load.get('label', 'Unnamed Load')
-            self.controlPane.addLoad(label, new_load)
-            self.addConstraint(new_load)
-
-        for controller in parsed.get('tendon-controllers', []):
-            limit = controller.get('limit', 100)
-            max_speed = controller.get('max-speed', 50)
-            max_force = controller.get('max-force', 5000)
-            new_controller = TendonController(elastics[controller['elastic']],
-                                              controller['label'],
-                                              limit=limit, max_force=max_force,
-                                              max_speed=max_speed)
-            self.addTendonController(new_controller)
-            controllers[controller['elastic']] = new_controller
-
-        for coupled_controller in parsed.get('coupled-controllers', []):
-            extensor = controllers[coupled_controller['extensor']]
-            flexor = controllers[coupled_controller['flexor']]
-            new_controller = CoupledTendonController(extensor, flexor)
-            label = coupled_controller['label']
-            self.controlPane.addComboController(label, new_controller)
-
-        for label in parsed.get('labels', []):
-            pos = label['pos']
-            text = label['text']
-            new_label = Label(self.scene,
-                              QPoint(pos[0]*world_scale, pos[1]*world_scale),
-                              text)
+                label = Label(self.scene, scene_pos, text)
+            self.labels.append(label)
+        for label in labels:
+            label.cleanup()
 
         # mouse logic
         self.mouseDrag = MouseDrag(self)
-
-    def __init__(self):
+        self.scheduler.reset()
+        self.meter.reset()
+        self.idle = False
+        self.restDetector = RestDetector(self.sim) if settle_idle else None
+        if self.inputPath is not None:
+            # Input recordings start from the scene as loaded, before the
+            # physics thread takes its first step
+            self.inputRecorder = InputRecorder(self.sim, self.inputPath,
+                                               self.mouseDrag.drag)
+            self.inputPath = None
+            self.recordInputsButton.setText('Stop Recording Inputs')
+        if self.threaded:
+            self.startWorker()
+        # Playback stops the timer, which is needed again once live
+        if not self.paused and not self.timer.isActive():
+            self.timer.start()
+
+    def __init__(self, sim=None):
         QWidget.__init__(self)
+        # Physics may run on a worker thread, see startWorker
+        self.threaded = gui_threaded_physics
+        self.worker = None
+        # All bodies and constraints may be drawn by one SceneRenderer item,
+        # which needs numpy; otherwise each has its own scene items
+        self.batched = render_batched and SceneRenderer.available
+        self.renderer = None
         root_layout = QHBoxLayout(self)
-        self.controlPane = ControlPane()
+        self.controlPane = ControlPane(post=self.post)
         root_layout.addWidget(self.controlPane)
         layout = QVBoxLayout()
         root_layout.addLayout(layout)
@@ -177,6 +147,11 @@ class Window(QWidget):
         self.pauseButton = QPushButton('Toggle Pause', self)
         self.pauseButton.clicked.connect(self.togglePause)
         buttonsLayout.addWidget(self.pauseButton)
+        # Turbo button - runs physics as fast as it goes, redrawing less often
+        self.turbo = False
+        self.turboButton = QPushButton('Turbo', self)
+        self.turboButton.clicked.connect(self.toggleTurbo)
+        buttonsLayout.addWidget(self.turboButton)
         # Reset button - resets the scene
         self.resetButton = QPushButton('Reset', self)
         self.resetButton.clicked.connect(self.reset)
@@ -186,20 +161,60 @@ class Window(QWidget):
         self.forceButton = QPushButton('Toggle Force Display', self)
         self.forceButton.clicked.connect(self.toggleForces)
         buttonsLayout.addWidget(self.forceButton)
+        # Record button - toggles trajectory recording
+        self.recording = False
+        self.recordButton = QPushButton('Record', self)
+        self.recordButton.clicked.connect(self.toggleRecording)
+        buttonsLayout.addWidget(self.recordButton)
+        # Record Inputs button - records inputs from a reset, for replaying
+        # headless (see senesim.inputs)
+        self.inputRecorder = None
+        self.inputPath = None
+        self.recordInputsButton = QPushButton('Record Inputs', self)
+        self.recordInputsButton.clicked.connect(self.toggleInputRecording)
+        buttonsLayout.addWidget(self.recordInputsButton)
+        # Playback button - scrubs through a recording instead of simulating
+        self.playback = None
+        self.playbackButton = QPushButton('Play Recording', self)
+        self.playbackButton.clicked.connect(self.openRecording)
+        buttonsLayout.addWidget(self.playbackButton)
+        # Profile button - times each phase of the loop, shown in an overlay
+        self.profiler = None
+        self.profileButton = QPushButton('Profile', self)
+        self.profileButton.clicked.connect(self.toggleProfiling)
+        buttonsLayout.addWidget(self.profileButton)
+        self.exportProfileButton = QPushButton('Export Profile', self)
+        self.exportProfileButton.clicked.connect(self.exportProfile)
+        self.exportProfileButton.hide()
+        buttonsLayout.addWidget(self.exportProfileButton)
         # Label shows frame progression
         self.label = QLabel('Not started', self)
         buttonsLayout.addWidget(self.label)
         layout.addLayout(buttonsLayout)
-
-        # begin ticking
-        self._active = True
+        # Playback scrubber, only shown while playing back
+        self.playbackSlider = QSlider(Qt.Horizontal, self)
+        self.playbackSlider.valueChanged.connect(self.showFrame)
+        self.playbackSlider.hide()
+        layout.addWidget(self.playbackSlider)
+
+        # begin ticking - physics runs at a fixed rate, paced against real
+        # time, and the view is redrawn once per timer tick
         self.paused = False
-        QTimer.singleShot(0, self.runLoop)
+        # Stepping also stops while the simulation is at rest, until
+        # something is posted (see RestDetector)
+        self.idle = False
+        self.restDetector = None
         self.frame_n = 0
+        self.scheduler = FixedStepScheduler()
+        self.meter = RateMeter(self.scheduler.delta_t)
+        self.lastRefresh = 0
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.tick)
+        self.timer.start(int(1000 / render_fps))
 
         # graphics
         self.scene = QGraphicsScene()
-        self.view = QGraphicsView(self.scene)
+        self.view = ProfiledGraphicsView(self.scene)
         self.view.viewport().setFocusProxy(None)
         self.view.setRenderHints(
             QPainter.Antialiasing)
@@ -207,14 +222,26 @@ class Window(QWidget):
         self.view.scale(1, -1)
         layout.addWidget(self.view)
         self.view.viewport().installEventFilter(self)
+        self.profileOverlay = QLabel(self.view)
+        self.profileOverlay.setFont(QFont('Monospace', 8))
+        self.profileOverlay.setStyleSheet(
+            'background: rgba(255, 255, 255, 200); padding: 4px')
+        self.profileOverlay.move(5, 5)
+        self.profileOverlay.hide()
+        # Items owned by the window rather than by scene objects
+        self.labels = []
+        self.mouseDrag = None
 
-        # physics
-        self.world = b2World(warmStarting=world_warm_start)
-        self.constraints = []
-        self.controllers = []
+        # physics - the window is a viewer for a (possibly shared) simulation
+        if sim is None:
+            sim = Simulation()
+        self.sim = sim
+        self.world = self.sim.world
 
         # File loading
-        if len(sys.argv) > 1:
+        if sim.filePath is not None:
+            self.filePath = sim.filePath
+        elif len(sys.argv) > 1:
             self.filePath = sys.argv[1]
         else:
             self.filePath = 'default.yml'
@@ -224,6 +251,13 @@ class Window(QWidget):
 
     def eventFilter(self, source, event):
         """Event filter for graphicsview interaction"""
+        if self.profiler is None:
+            self.handleEvent(event)
+        else:
+            self.profiler.time('events', self.handleEvent, event)
+        return super(Window, self).eventFilter(source, event)
+
+    def handleEvent(self, event):
         if event.type() == QEvent.MouseMove:
             # if event.buttons() == Qt.NoButton:
             #     print("Simple mouse motion")
@@ -240,62 +274,274 @@ class Window(QWidget):
         elif event.type() == QEvent.KeyPress:
             if event.key() == Qt.Key_Space:
                 self.togglePause()
-        return super(Window, self).eventFilter(source, event)
 
     def closeEvent(self, event):
-        self._active = False
-
-    def addConstraint(self, constraint):
-        self.constraints.append(constraint)
-
-    def addTendonController(self, controller):
-        self.controlPane.addElasticController(controller)
-        self.controllers.append(controller)
+        self.timer.stop()
+        self.stopWorker()
+
+    def startWorker(self):
+        '''Hands the simulation over to a physics thread. From here on, all
+        changes to it must be made through post().'''
+        objects = self.movingBodies + self.sim.constraints + [self.mouseDrag]
+        self.worker = SimulationWorker(self.sim, objects, paused=self.paused,
+                                       turbo=self.turbo)
+        self.worker.start()
+
+    def stopWorker(self):
+        if self.worker:
+            self.worker.stop()
+            self.worker = None
+
+    def post(self, function, *args):
+        '''Makes a change to the simulation, on the physics thread if there
+        is one.'''
+        if self.inputRecorder is not None:
+            function, args = self.inputRecorder.apply, (function,) + args
+        if self.worker:
+            self.worker.post(function, *args)
+        else:
+            function(*args)
+            if self.idle:
+                self.scheduler.reset()
+                self.meter.reset()
+            self.idle = False
+            if self.restDetector is not None:
+                self.restDetector.reset()
 
     def togglePause(self):
+        if self.playback:
+            return
         self.paused = not self.paused
+        if self.worker:
+            self.worker.setPaused(self.paused)
+        # Paused windows don't tick at all
+        if self.paused:
+            self.timer.stop()
+        else:
+            self.scheduler.reset()
+            self.meter.reset()
+            self.timer.start()
+
+    def toggleTurbo(self):
+        '''Switches between running the physics in real time and running it
+        as fast as it goes, with the view redrawn turbo_refresh_fps times a
+        second.'''
+        self.turbo = not self.turbo
+        self.turboButton.setText('Real Time' if self.turbo else 'Turbo')
+        if self.worker:
+            self.worker.setTurbo(self.turbo)
+        self.scheduler.reset()
+        self.meter.reset()
+
+    def toggleProfiling(self):
+        '''Starts or stops timing the phases of the loop. Physics phases are
+        timed where the physics runs, and drawing phases here.'''
+        if self.profiler is None:
+            self.profiler = Profiler()
+            self.post(self.sim.setProfiler, Profiler())
+            self.profileOverlay.setText('Profiling...')
+            self.profileOverlay.adjustSize()
+            self.profileOverlay.show()
+            self.exportProfileButton.show()
+            self.profileButton.setText('Stop Profiling')
+        else:
+            self.profiler = None
+            self.post(self.sim.setProfiler, None)
+            self.profileOverlay.hide()
+            self.exportProfileButton.hide()
+            self.profileButton.setText('Profile')
+        self.view.profiler = self.profiler
+
+    def updateProfileOverlay(self):
+        physics = self.sim.profiler
+        text = 'Physics\n' + physics.report() if physics else ''
+        text += '\n\nDrawing\n' + self.profiler.report()
+        self.profileOverlay.setText(text)
+        self.profileOverlay.adjustSize()
+
+    def exportProfile(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, 'Export Profile', '', 'JSON (*.json)')
+        if path:
+            writeProfile(path, {'physics': self.sim.profiler,
+                                'drawing': self.profiler})
+
+    def toggleRecording(self):
+        if self.recording:
+            self.post(self.sim.stopRecording)
+            self.recording = False
+            self.recordButton.setText('Record')
+            return
+        path, _ = QFileDialog.getSaveFileName(
+            self, 'Record Trajectory', '', 'Recordings (*.senerec)')
+        if not path:
+            return
+        self.post(self.sim.startRecording, path)
+        self.recording = True
+        self.recordButton.setText('Stop Recording')
+
+    def toggleInputRecording(self):
+        '''Starts recording inputs from a freshly reset scene, or stops.'''
+        if self.inputRecorder is not None:
+            self.post(self.inputRecorder.close)
+            self.inputRecorder = None
+            self.recordInputsButton.setText('Record Inputs')
+            return
+        path, _ = QFileDialog.getSaveFileName(
+            self, 'Record Inputs', '', 'Input recordings (*.seneinp)')
+        if not path:
+            return
+        self.inputPath = path
+        self.reset()
 
-    def runLoop(self):
-        from time import sleep
-        self.frame_n = 0
-        while True:
-            sleep(0.01)
-            if not self.paused:
+    def openRecording(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, 'Play Recording', '', 'Recordings (*.senerec)')
+        if path:
+            self.startPlayback(path)
+
+    def startPlayback(self, path):
+        '''Loads the recording's scene, then shows recorded frames in place
+        of the simulation, which is not stepped. Reset returns to live.'''
+        trajectory = Trajectory(path)
+        if trajectory.scene:
+            self.filePath = trajectory.scene
+        self.reset()
+        self.stopWorker()
+        self.timer.stop()
+        self.playback = trajectory
+        # Forces aren't recorded
+        for constraint in self.sim.constraints:
+            constraint.hideForces()
+        if self.renderer is not None:
+            self.renderer.forcesVisible = False
+        self.playbackSlider.setRange(0, max(len(trajectory) - 1, 0))
+        self.playbackSlider.setValue(0)
+        self.playbackSlider.show()
+        self.showFrame(0)
+
+    def showFrame(self, frame):
+        if not self.playback or frame >= len(self.playback):
+            return
+        # Pose the bodies as recorded, without stepping the world
+        states = self.playback.bodyStates(frame)
+        for body, (x, y, angle) in zip(self.sim.bodies, states):
+            body.body.transform = ((x, y), angle)
+        self.sim.invalidateGeometry()
+        self.updateGraphics()
+        self.label.setText('Step %d' % self.playback[frame]['step'])
+
+    def tick(self):
+        if self.profiler is not None:
+            self.profiler.time('tick_total', self.runTick)
+            self.profiler.endFrame()
+            if self.frame_n % profile_overlay_interval == 0:
+                self.updateProfileOverlay()
+        else:
+            self.runTick()
+
+    def runTick(self):
+        if self.worker:
+            # Draw the latest snapshot published by the physics thread
+            with self.worker.lock:
+                if not self.worker.fresh:
+                    return
+                self.worker.fresh = False
                 self.frame_n = self.frame_n + 1
-                self.label.setText('Frame %d' % self.frame_n)
-                # physics update
-                for i in range(world_outer_iterations):
-                    for controller in self.controllers:
-                        controller.update(1 / world_fps)
-                    for constraint in self.constraints:
-                        constraint.updateForces(1 / world_fps)
-                    self.world.Step(
-                        1 / world_fps,
-                        world_iterations,
-                        world_iterations)
-                    if world_clear_forces:
-                        self.world.ClearForces()
-                # graphics update
-                self.mouseDrag.updateGraphics()
-                for body in self.world.bodies:
-                    if body.userData:
-                        body.userData.updateGraphics()
-                for constraint in self.constraints:
-                    constraint.updateGraphics()
-            # Keep the app running
-            qApp.processEvents()
-            if not self._active:
+                self.updateGraphics(self.worker.front)
+            self.updateLabel(self.worker.idle, self.worker.meter)
+            return
+        if self.idle:
+            return
+        # physics update
+        if self.turbo:
+            self.meter.add(self.runTurbo())
+            now = perf_counter()
+            if (not self.idle and
+                    now - self.lastRefresh < 1 / turbo_refresh_fps):
+                return
+            self.lastRefresh = now
+        else:
+            steps = self.scheduler.stepsDue()
+            self.sim.advance(steps, self.scheduler.delta_t)
+            self.meter.add(steps)
+            if self.restDetector is not None:
+                self.idle = self.restDetector.update()
+        self.frame_n = self.frame_n + 1
+        self.updateGraphics()
+        self.updateLabel(self.idle, self.meter)
+
+    def runTurbo(self):
+        '''Runs whole frames, as fast as they go, for one tick's worth of
+        real time (so that the window stays responsive), or until the
+        simulation comes to rest. Returns the number of substeps run.'''
+        deadline = perf_counter() + 1 / render_fps
+        steps = 0
+        while perf_counter() < deadline:
+            self.sim.advance(world_outer_iterations, self.scheduler.delta_t)
+            steps += world_outer_iterations
+            if self.restDetector is not None and self.restDetector.update():
+                self.idle = True
                 break
+        return steps
+
+    def updateLabel(self, idle, meter):
+        '''Shows the frame number, and how fast the physics is running.'''
+        text = 'Frame %d' % self.frame_n
+        if idle:
+            text += ' (at rest)'
+        elif meter.realtimeFactor is not None:
+            text += ', %.2fx real time, %d substeps/s' % (
+                meter.realtimeFactor, meter.substepsPerSecond)
+        self.label.setText(text)
+
+    def updateGraphics(self, snapshot=None):
+        '''Syncs the scene items with the simulation, or with a snapshot of
+        it. Only items of bodies that moved, and of constraints attached to
+        them, are actually changed.'''
+        states = snapshot.states if snapshot is not None else None
+        if self.renderer is not None:
+            if self.profiler is None:
+                self.renderer.setStates(states)
+            else:
+                self.profiler.time('batched_graphics',
+                                   self.renderer.setStates, states)
+            self.drawObjects([self.mouseDrag], states)
+            return
+        constraints = self.sim.constraints + [self.mouseDrag]
+        if self.profiler is None:
+            self.drawObjects(self.movingBodies, states)
+            self.drawObjects(constraints, states)
+        else:
+            self.profiler.time('body_graphics', self.drawObjects,
+                               self.movingBodies, states)
+            self.profiler.time('constraint_graphics', self.drawObjects,
+                               constraints, states)
+
+    def drawObjects(self, objects, states=None):
+        '''Updates the scene items of objects, from their states in a
+        snapshot if given (objects without a state are left alone).'''
+        if states is None:
+            for obj in objects:
+                obj.updateGraphics()
+        else:
+            for obj in objects:
+                state = states.get(obj)
+                if state is not None:
+                    obj.updateGraphics(state)
 
     def toggleForces(self):
         if self.forcesVisible:
             self.forcesVisible = False
-            for constraint in self.constraints:
+            for constraint in self.sim.constraints:
                 constraint.hideForces()
         else:
             self.forcesVisible = True
-            for constraint in self.constraints:
+            for constraint in self.sim.constraints:
                 constraint.showForces()
+        if self.renderer is not None:
+            self.renderer.forcesVisible = self.forcesVisible
+            self.renderer.update()
 
 
     def viewToWorld(self, p):
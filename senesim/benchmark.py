@@ -0,0 +1,278 @@
+'''Benchmarks: runs scenes headless for a fixed number of substeps, and
+reports substeps per second, time per phase and peak memory.
+
+    python -m senesim.benchmark --out bench.json
+    python -m senesim.benchmark --baseline bench.json --threshold 0.1
+
+Scenes are YAML files, or 'file*N' for N copies of a file side by side
+(e.g. finger.yml*40), for larger scenes. Each scene runs in a fresh
+process. With --baseline, results are compared against an earlier run and
+the exit status is 1 if any scene is slower (or uses more memory) than the
+thresholds allow.
+'''
+import argparse
+import copy
+import json
+import multiprocessing
+import platform
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from senesim.config import *
+from senesim.profiler import Profiler
+from senesim.scenecache import loadSceneFile
+from senesim.simulation import Simulation
+from senesim.worker import Snapshot
+
+default_scenes = ['default.yml', 'rope.yml', 'two-rope.yml', 'finger.yml',
+                  'finger.yml*40', 'two-rope.yml*20']
+
+# Phases of a substep (see Simulation.profiledStep), then the per-frame
+# graphics sync
+phases = ['controllers', 'forces', 'world_step', 'geometry', 'clear_forces',
+          'graphics_sync']
+
+
+def tileScene(parsed, copies):
+    '''Returns a scene made of copies of a parsed scene, stacked vertically
+    so that they don't touch. Ids are suffixed with the copy's index; the
+    ground is shared.'''
+    extents = [(body['pos'][1] - body.get('height', body.get('radius', 0)),
+                body['pos'][1] + body.get('height', body.get('radius', 0)))
+               for body in parsed.get('bodies', [])]
+    if extents:
+        spacing = (max(top for bottom, top in extents) -
+                   min(bottom for bottom, top in extents) + 0.5)
+    else:
+        spacing = 1
+    tiled = {}
+    for i in range(copies):
+        dy = i * spacing
+
+        def rename(name):
+            return name if name == '_ground' else '{0}-{1}'.format(name, i)
+
+        def shift(point):
+            return [point[0], point[1] + dy]
+
+        for section, entries in parsed.items():
+            for entry in entries:
+                entry = copy.deepcopy(entry)
+                for key in ('id', 'body', 'bodyA', 'bodyB', 'extensor',
+                            'flexor'):
+                    if key in entry:
+                        entry[key] = rename(entry[key])
+                if section == 'tendon-controllers':
+                    entry['elastic'] = rename(entry['elastic'])
+                for key in ('pos', 'anchor', 'anchorA', 'anchorB'):
+                    if key in entry:
+                        entry[key] = shift(entry[key])
+                for contact in entry.get('contacts', []):
+                    contact['body'] = rename(contact['body'])
+                    contact['point'] = shift(contact['point'])
+                if section in ('tendon-controllers', 'coupled-controllers',
+                               'loads'):
+                    entry['label'] = '{0} {1}'.format(
+                        entry.get('label', 'Unnamed Load'), i)
+                tiled.setdefault(section, []).append(entry)
+    return tiled
+
+
+def loadBenchmarkScene(spec):
+    '''Builds the Simulation for a scene spec, 'file' or 'file*N'.'''
+    path, _, copies = spec.partition('*')
+    sim = Simulation()
+    if copies:
+        sim.build(tileScene(loadSceneFile(path), int(copies)))
+    else:
+        sim.load(path)
+    return sim
+
+
+def getPeakMemory():
+    '''Peak resident memory of this process in MB, where available.'''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return peak / 2 ** 20
+    return peak / 2 ** 10
+
+
+def runSteps(sim, steps, delta_t):
+    '''Runs the scene as the GUI worker does, a frame at a time, taking a
+    display snapshot after each frame. Returns the elapsed time.'''
+    objects = sim.bodies + sim.constraints
+    snapshot = Snapshot()
+    start = perf_counter()
+    for frame in range(steps // world_outer_iterations):
+        sim.advance(world_outer_iterations, delta_t)
+        snapshot.capture(sim, objects)
+    return perf_counter() - start
+
+
+def timePhases(sim, steps, delta_t):
+    '''As runSteps, but timing each phase with a Profiler. Returns total
+    seconds per phase.'''
+    objects = sim.bodies + sim.constraints
+    snapshot = Snapshot()
+    profiler = Profiler()
+    sim.setProfiler(profiler)
+    for frame in range(steps // world_outer_iterations):
+        sim.advance(world_outer_iterations, delta_t)
+        profiler.time('graphics_sync', snapshot.capture, sim, objects)
+    sim.setProfiler(None)
+    return profiler.totals
+
+
+def runBenchmark(spec, steps, repeat, adaptive=False):
+    '''Benchmarks one scene. Substeps per second is the best of repeat runs,
+    each from a freshly built scene; phase times come from one more run.
+    Substeps are counted in units of 1/world_fps of simulated time, so that
+    adaptive runs, which take fewer (longer) world steps, are comparable.'''
+    delta_t = 1 / world_fps
+    # Whole frames only, and at least one
+    steps = max(steps - steps % world_outer_iterations, world_outer_iterations)
+    best = None
+    for i in range(repeat):
+        sim = loadBenchmarkScene(spec)
+        sim.setAdaptiveStep(adaptive)
+        elapsed = runSteps(sim, steps, delta_t)
+        best = elapsed if best is None else min(best, elapsed)
+    sim = loadBenchmarkScene(spec)
+    sim.setAdaptiveStep(adaptive)
+    totals = timePhases(sim, steps, delta_t)
+    frames = steps // world_outer_iterations
+    return {
+        'bodies': len(sim.bodies),
+        'constraints': len(sim.constraints),
+        'controllers': len(sim.controllers),
+        'substeps_per_second': steps / best,
+        'world_steps': sim.step_n,
+        # Microseconds per substep, except graphics sync (per frame)
+        'phases_us': {
+            phase: totals.get(phase, 0.0) * 1e6 / (
+                frames if phase == 'graphics_sync' else steps)
+            for phase in phases},
+        'peak_memory_mb': getPeakMemory(),
+    }
+
+
+def benchmark(scenes, steps=4000, repeat=3, adaptive=False):
+    '''Benchmarks each scene in a fresh process, so that memory peaks are
+    per scene. Returns the results document.'''
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for spec in scenes:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results[spec] = pool.submit(runBenchmark, spec, steps,
+                                        repeat, adaptive).result()
+        print(formatResult(spec, results[spec]))
+    return {
+        'config': {
+            'steps': steps,
+            'repeat': repeat,
+            'delta_t': 1 / world_fps,
+            'world_iterations': world_iterations,
+            'world_batch_elastics': world_batch_elastics,
+            'world_batch_elastics_min': world_batch_elastics_min,
+            'adaptive_step': adaptive,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+        },
+        'results': results,
+    }
+
+
+def formatResult(spec, result):
+    phases_us = result['phases_us']
+    return '{0:<20} {1:>10.0f} substeps/s  {2}  peak {3}'.format(
+        spec, result['substeps_per_second'],
+        ' '.join('{0} {1:.1f}us'.format(phase, phases_us[phase])
+                 for phase in phases),
+        'n/a' if result['peak_memory_mb'] is None
+        else '{0:.0f}MB'.format(result['peak_memory_mb']))
+
+
+def compare(current, baseline, threshold=0.1, memory_threshold=0.2):
+    '''Compares results against a baseline. Returns a list of regressions,
+    as messages: scenes whose substeps per second fell by more than
+    threshold, or whose peak memory grew by more than memory_threshold
+    (both fractions of the baseline).'''
+    regressions = []
+    for spec, result in current['results'].items():
+        base = baseline['results'].get(spec)
+        if base is None:
+            continue
+        slowdown = 1 - (result['substeps_per_second'] /
+                        base['substeps_per_second'])
+        if slowdown > threshold:
+            regressions.append('{0}: {1:.1%} slower ({2:.0f} -> {3:.0f} '
+                               'substeps/s)'.format(
+                                   spec, slowdown,
+                                   base['substeps_per_second'],
+                                   result['substeps_per_second']))
+        if result['peak_memory_mb'] and base['peak_memory_mb']:
+            growth = result['peak_memory_mb'] / base['peak_memory_mb'] - 1
+            if growth > memory_threshold:
+                regressions.append('{0}: {1:.1%} more memory'.format(
+                    spec, growth))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m senesim.benchmark',
+        description='Benchmark the simulator on a set of scenes.')
+    parser.add_argument('scenes', nargs='*', default=default_scenes,
+                        help='YAML scene files, or file*N for N copies '
+                             '(default: the bundled scenes)')
+    parser.add_argument('--steps', type=int, default=4000,
+                        help='Substeps to run each scene for')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per scene; the fastest is reported')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Use adaptive substeps (see AdaptiveStepSize)')
+    parser.add_argument('--out', help='Write results to this JSON file')
+    parser.add_argument('--baseline',
+                        help='Compare against results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Allowed slowdown against the baseline, as a '
+                             'fraction')
+    parser.add_argument('--memory-threshold', type=float, default=0.2,
+                        help='Allowed peak memory growth against the '
+                             'baseline, as a fraction')
+    args = parser.parse_args(argv)
+    if args.steps < world_outer_iterations:
+        parser.error('--steps must be at least {0} (one frame)'.format(
+            world_outer_iterations))
+    if args.repeat < 1:
+        parser.error('--repeat must be at least 1')
+
+    results = benchmark(args.scenes, args.steps, args.repeat, args.adaptive)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('Wrote {0}'.format(args.out))
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold,
+                              args.memory_threshold)
+        for message in regressions:
+            print('REGRESSION ' + message)
+        if regressions:
+            return 1
+        print('No regressions against {0}'.format(args.baseline))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
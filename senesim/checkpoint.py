@@ -0,0 +1,86 @@
+from senesim.scene import Elastic
+
+
+class Checkpoint(object):
+    '''The complete state of a Simulation at one step, held in memory: body
+    transforms, velocities and sleep state, joint motor and limit settings,
+    elastic rest lengths and extensions, controller positions and targets,
+    and load forces. A checkpoint can be restored into the simulation it was
+    taken from, any number of times, without rebuilding the scene.
+
+    Box2D's warm starting impulses are not exposed, so a restored run starts
+    cold: its first step is not warm started. Restored runs therefore match
+    the original run closely, but not bit for bit.'''
+
+    def __init__(self, sim):
+        self.compiled = sim.compiled
+        self.step_n = sim.step_n
+        self.bodies = [
+            (tuple(b.position), b.angle, tuple(b.linearVelocity),
+             b.angularVelocity, b.awake)
+            for b in (body.body for body in sim.bodies)]
+        self.joints = [
+            (j.motorSpeed, j.motorEnabled, j.GetMaxMotorTorque(),
+             j.limitEnabled, j.lowerLimit, j.upperLimit)
+            for j in sim.joints]
+        self.constraints = []
+        for constraint in sim.constraints:
+            if isinstance(constraint, Elastic):
+                self.constraints.append(
+                    (constraint.restLength, constraint.calculatedRestLength,
+                     constraint.last_extension, constraint.k,
+                     constraint.damping))
+            else:
+                self.constraints.append(
+                    (tuple(constraint.force), constraint.max))
+        self.controllers = [
+            (c.position, c.target, c.limit, c.maxForce, c.maxSpeed)
+            for c in sim.controllers]
+        self.coupledControllers = [c.target for c in sim.coupledControllers]
+
+    def matches(self, sim):
+        return (sim.compiled is self.compiled and
+                len(sim.bodies) == len(self.bodies) and
+                len(sim.constraints) == len(self.constraints))
+
+    def restore(self, sim):
+        '''Puts the simulation back in the checkpointed state.'''
+        if not self.matches(sim):
+            raise Exception('Checkpoint was taken from a different scene')
+        for body, state in zip(sim.bodies, self.bodies):
+            position, angle, velocity, angular_velocity, awake = state
+            b = body.body
+            b.transform = (position, angle)
+            # Going to sleep and waking resets the body's sleep timer
+            b.awake = False
+            b.awake = True
+            b.linearVelocity = velocity
+            b.angularVelocity = angular_velocity
+            b.awake = awake
+        for j, state in zip(sim.joints, self.joints):
+            (j.motorSpeed, j.motorEnabled, j.maxMotorTorque, j.limitEnabled,
+             lower, upper) = state
+            j.SetLimits(lower, upper)
+        for constraint, state in zip(sim.constraints, self.constraints):
+            if isinstance(constraint, Elastic):
+                (constraint.restLength, constraint.calculatedRestLength,
+                 constraint.last_extension, constraint.k,
+                 constraint.damping) = state
+                constraint.appliedForces = None
+            else:
+                force, constraint.max = state
+                constraint.setForce(force)
+        for c, state in zip(sim.controllers, self.controllers):
+            c.position, target, c.limit, c.maxForce, c.maxSpeed = state
+            # Through setTarget, so that controls follow
+            c.setTarget(target)
+        sim.invalidateControllers()
+        for c, target in zip(sim.coupledControllers, self.coupledControllers):
+            c.target = target
+            for f in c.subscribers:
+                f()
+        sim.world.ClearForces()
+        sim.invalidateGeometry()
+        sim.step_n = self.step_n
+        # Joint impulses from before the restore must not be warm started
+        sim.coldStart = True
@@ -1,4 +1,4 @@
-from PyQt5.QtGui import QColor
+import os
 
 default_density = 1
 default_friction = 0.4
@@ -12,3 +12,38 @@ world_iterations = 30
 world_outer_iterations = 40
 world_clear_forces = True
 world_warm_start = True
+world_batch_elastics = True
+world_batch_elastics_min = 8
+world_batch_controllers = True
+world_batch_controllers_min = 200
+world_realtime_factor = 1.0
+world_max_substeps_per_tick = 4 * world_outer_iterations
+world_adaptive_step = False
+adaptive_min_step = 1 / world_fps
+adaptive_max_step = 8 / world_fps
+adaptive_safety = 0.9
+adaptive_max_travel = 0.01
+render_fps = 60
+turbo_refresh_fps = 10
+rate_meter_interval = 0.5
+graphics_move_threshold = 0.25
+render_batched = False
+gui_threaded_physics = True
+settle_linear_velocity = 0.001
+settle_angular_velocity = 0.01
+settle_kinetic_energy = 1e-6
+settle_tension_change = 0.01
+settle_position_change = 0.001
+settle_frames = 5
+settle_idle = True
+equilibrium_tolerance = 1e-4
+equilibrium_step_tolerance = 1e-6
+equilibrium_max_iterations = 200
+equilibrium_max_step = 0.5
+equilibrium_difference_step = 1e-4
+equilibrium_settle_steps = 20000
+equilibrium_check_steps = 400
+equilibrium_check_tolerance = 0.01
+scene_cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'senesim')
+profile_window = 300
+profile_overlay_interval = 15
@@ -1,10 +1,16 @@
-from PyQt5.QtWidgets import *
-from PyQt5.QtCore import *
-from PyQt5.QtGui import *
+from itertools import chain
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 from Box2D import *
 
 from senesim.config import *
+from senesim.rootfind import brentq
+from senesim.scene.elastic import Elastic
+
 
 class TendonController(object):
     '''Simple controller tracks length limits.'''
@@ -18,15 +24,33 @@ class TendonController(object):
         self.subscribers = []
         self.maxForce = max_force
         self.maxSpeed = max_speed
+        # The ControllerBatch holding this controller's state, if any, and
+        # its index there
+        self.batch = None
+        self.index = None
 
     def setLimit(self, limit):
         self.limit = limit
+        if self.batch:
+            self.batch.limit[self.index] = limit
+
+    def setMaxForce(self, max_force):
+        self.maxForce = max_force
+        if self.batch:
+            self.batch.maxForce[self.index] = max_force
+
+    def setMaxSpeed(self, max_speed):
+        self.maxSpeed = max_speed
+        if self.batch:
+            self.batch.maxSpeed[self.index] = max_speed
 
     def getLimit(self):
         return self.limit
 
     def setTarget(self, target):
         self.target = target
+        if self.batch:
+            self.batch.target[self.index] = target
         for f in self.subscribers:
             f()
 
@@ -38,41 +62,31 @@ class TendonController(object):
         return self.position
 
     def reelOut(self, delta_t):
-        '''Settles on a new position at the limit of the motor's force output'''
-        # # First, increase our upper bound until the forces drop below the max
-        # n = 0
-        # tmp_pos = self.position * 2
-        # print('starting, current pos {0:.2f}'.format(self.position))
-        # while n < 20:
-        #     self.elastic.setRestLength(self.rest + tmp_pos)
-        #     internal_force = self.elastic.getInternalForce(delta_t)
-        #     if internal_force < self.maxForce:
-        #         break
-        #     else:
-        #         print('force {0:.2f}'.format(internal_force))
-        #         tmp_pos *= 2
-        #     n += 1
-        #     print('pos {0:.2f}'.format(tmp_pos))
-        # # tmp_pos is now our high bound, and tmp_pos/2 the low bound.
-        # # Bisection search finds the point where the internal force ~=
-        # # the maximum output force. (stops with epsilon < 0.001)
-
-        # Use the maximum limit as a bound
-        n = 0
+        '''Settles on a new position at the limit of the motor's force
+        output'''
+        # The position is bounded by the current position and the maximum
+        # limit. Where the elastic's law can be inverted, solve for the rest
+        # length that gives exactly the maximum force; otherwise find it with
+        # a bracketed root search.
         low = self.position
         high = self.limit
-        while n < 20:
-            mid = (low + high) / 2
-            self.elastic.setRestLength(self.rest + mid)
-            internal_force = self.elastic.getInternalForce(delta_t)
-            if abs(internal_force - self.maxForce) < 0.001:
-                break
-            elif internal_force < self.maxForce:
-                high = mid
+        extension = self.elastic.getExtensionForTension(self.maxForce, delta_t)
+        if extension is not None:
+            pos = self.elastic.getLength() - self.rest - extension
+            pos = min(max(pos, low), high)
+        else:
+            def excessForce(pos):
+                self.elastic.setRestLength(self.rest + pos)
+                return self.elastic.getInternalForce(delta_t) - self.maxForce
+            # Force falls as the motor reels out
+            if excessForce(high) >= 0:
+                pos = high
+            elif excessForce(low) <= 0:
+                pos = low
             else:
-                low = mid
-            n += 1
-        self.position = mid
+                pos = brentq(excessForce, low, high, xtol=1e-4)
+        self.elastic.setRestLength(self.rest + pos)
+        self.position = pos
 
     def update(self, delta_t):
         '''Reel in or out up to the maximum speed and force'''
@@ -108,10 +122,12 @@ class TendonController(object):
 class CoupledTendonController(object):
     '''Coupled controller unifies control of two tendons (variable length
     elastics), treating one as 'extensor' and the other as 'flexor'.'''
-    def __init__(self, extensor_controller, flexor_controller):
+    def __init__(self, extensor_controller, flexor_controller,
+                 label='Unnamed'):
         # Tendon controllers
         self.flexor = flexor_controller
         self.extensor = extensor_controller
+        self.label = label
         self.target = 0
         self.subscribers = []
 
@@ -121,8 +137,8 @@ class CoupledTendonController(object):
             target = 1
         elif target < -1:
             target = -1
-        self.update()
         self.target = target
+        self.update()
         for f in self.subscribers:
             f()
 
@@ -135,3 +151,107 @@ class CoupledTendonController(object):
 
     def subscribeChange(self, function):
         self.subscribers.append(function)
+
+
+class ControllerBatch(object):
+    '''Updates many TendonControllers at once. The motor state of every
+    controller (position, target, limit, maxForce, maxSpeed) is kept in
+    arrays here, and each substep the speed-capped move and the force-capped
+    reel-out of TendonController.update are computed for all of them in one
+    vectorized pass, from the current elastic lengths. The results are the
+    same as updating each controller in turn.
+
+    While batched, controllers must be changed through their setters, which
+    write through to the arrays; positions are copied back to the
+    controllers after every update. Coupled controllers set targets through
+    setTarget, so they work unchanged. Only controllers of elastics with the
+    linear law can be batched; reel-outs with no closed form fall back to
+    TendonController.reelOut.'''
+
+    available = np is not None
+
+    def __init__(self, controllers):
+        self.controllers = list(controllers)
+        self.elastics = [c.elastic for c in self.controllers]
+        for name in ('position', 'target', 'limit', 'maxForce', 'maxSpeed',
+                     'rest'):
+            setattr(self, name, np.array(
+                [getattr(c, name) for c in self.controllers], dtype=float))
+        for n, controller in enumerate(self.controllers):
+            controller.batch = self
+            controller.index = n
+            # Controllers own their elastics' rest lengths from here on
+            controller.elastic.calculatedRestLength = False
+        # Where each elastic's length is found in an ElasticBatch
+        self.lengthSource = None
+        self.lengthIndex = None
+
+    @staticmethod
+    def canBatch(controller):
+        elastic = type(controller.elastic)
+        return (type(controller) is TendonController and
+                elastic.getTension is Elastic.getTension and
+                elastic.getExtensionForTension is
+                Elastic.getExtensionForTension)
+
+    def getLengths(self, elasticBatch):
+        '''Current elastic lengths, from an up to date ElasticBatch if there
+        is one.'''
+        if elasticBatch and elasticBatch.lengths is not None:
+            if elasticBatch is not self.lengthSource:
+                index = {e: n for n, e in enumerate(elasticBatch.elastics)}
+                self.lengthIndex = np.array(
+                    [index[e] for e in self.elastics], dtype=np.intp)
+                self.lengthSource = elasticBatch
+            return elasticBatch.lengths[self.lengthIndex]
+        return np.array([e.getLength() for e in self.elastics], dtype=float)
+
+    def update(self, delta_t, elasticBatch=None):
+        controllers = self.controllers
+        elastics = self.elastics
+        lengths = self.getLengths(elasticBatch)
+        params = chain.from_iterable(
+            (e.restLength, e.k, e.damping, e.last_extension)
+            for e in elastics)
+        rest_length, k, damping, last = np.fromiter(
+            params, dtype=float, count=4 * len(elastics)).reshape(-1, 4).T
+        position = self.position
+        rest = self.rest
+        max_force = self.maxForce
+
+        def getTension(extension):
+            # As Elastic.getTension, operation for operation
+            tension = damping * ((extension - last) / delta_t) + k * extension
+            tension[extension <= 0] = 0.0
+            return tension
+
+        # Move towards the target, by up to maxSpeed
+        step_speed = self.maxSpeed * delta_t
+        capped = np.minimum(np.maximum(self.target, position - step_speed),
+                            position + step_speed)
+        # Reel out where the force is over the maximum, before or after
+        reel = getTension(lengths - rest_length) > max_force
+        reel |= getTension(lengths - (rest + capped)) >= max_force
+        fallback = ()
+        if reel.any():
+            # As Elastic.getExtensionForTension
+            stiffness = k + damping / delta_t
+            solvable = stiffness > 0
+            stiffness[~solvable] = 1.0
+            extension = np.maximum(
+                (max_force + damping * last / delta_t) / stiffness, 0)
+            reeled = np.minimum(
+                np.maximum(lengths - rest - extension, position), self.limit)
+            np.copyto(capped, reeled, where=reel & solvable)
+            # Reel-outs without a closed form are left to reelOut, from the
+            # current position
+            fallback = np.flatnonzero(reel & ~solvable).tolist()
+            capped[fallback] = position[fallback]
+        self.position = capped
+        for c, pos in zip(controllers, capped.tolist()):
+            c.position = pos
+        for e, length in zip(elastics, (rest + capped).tolist()):
+            e.restLength = length
+        for n in fallback:
+            controllers[n].reelOut(delta_t)
+            capped[n] = controllers[n].position
@@ -4,7 +4,7 @@ from PyQt5.QtGui import *
 
 from Box2D import *
 
-from senesim import QSliderD
+from senesim.uiext import QSliderD
 
 length_str = '{0:.1f}'
 k_str = '{0:.1f}'
@@ -12,13 +12,21 @@ force_str = '{0:.1f}'
 speed_str = '{0:.1f}'
 length_range = 100
 
+
+def call(function, *args):
+    function(*args)
+
+
 class ElasticSliderBox(QGroupBox):
-    def __init__(self, elastic_controller):
+    # Controller changes may come from the physics thread
+    targetChanged = pyqtSignal()
+
+    def __init__(self, elastic_controller, post=call):
         self.minHeight = 40
         self.expandHeight = 90
         super(ElasticSliderBox, self).__init__(elastic_controller.label)
         # Slider box
-        self.elastic_controller = elastic_controller
+        self.elastic_controller = None
         self.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Minimum)
         self.setFixedWidth(170)
         self.setMinimumHeight(self.minHeight)
@@ -30,31 +38,38 @@ class ElasticSliderBox(QGroupBox):
         box_layout.addWidget(QLabel('Rest Length'))
 
         # The actual slider
-        slider = QSliderD(Qt.Horizontal, divisor=10)
+        slider = self.slider = QSliderD(Qt.Horizontal, divisor=10)
         slider.setLimits(-length_range, length_range)
         def valChange():
-            elastic_controller.setTarget(slider.value())
+            post(self.elastic_controller.setTarget, slider.value())
+            self.textBox.blockSignals(True)
             self.textBox.setText(length_str.format(slider.value()))
+            self.textBox.blockSignals(False)
         def valExternalChange():
+            if slider.isSliderDown():
+                return
             slider.blockSignals(True)
-            slider.setValue(elastic_controller.getTarget())
+            slider.setValue(self.elastic_controller.getTarget())
             slider.blockSignals(False)
-            self.textBox.setText(length_str.format(elastic_controller.getTarget()))
+            self.textBox.blockSignals(True)
+            self.textBox.setText(
+                length_str.format(self.elastic_controller.getTarget()))
+            self.textBox.blockSignals(False)
         slider.valueChanged.connect(valChange)
         slider.setTickInterval(10)
         slider.setTickPosition(QSlider.TicksBelow)
-        elastic_controller.subscribeChange(valExternalChange)
+        self.targetChanged.connect(valExternalChange)
         expander_stack.addWidget(slider)
 
         # Text readout
-        self.textBox = QLineEdit(length_str.format(0))
+        self.textBox = QLineEdit()
         self.textBox.setMaximumWidth(80)
         def lengthTextChange():
             try:
                 val = float(self.textBox.text())
             except:
                 return
-            elastic_controller.setTarget(val)
+            post(self.elastic_controller.setTarget, val)
             slider.blockSignals(True)
             slider.setValue(val)
             slider.blockSignals(False)
@@ -72,17 +87,17 @@ class ElasticSliderBox(QGroupBox):
         self.expandWidget = QWidget()
         expander_stack.addWidget(self.expandWidget)
         expanded_layout = QFormLayout(self.expandWidget)
-        range_box = QLineEdit(length_str.format(length_range))
+        range_box = self.rangeBox = QLineEdit()
         def rangeTextChange():
             try:
                 val = float(range_box.text())
             except:
                 return
-            elastic_controller.setLimit(val)
+            post(self.elastic_controller.setLimit, val)
             slider.blockSignals(True)
             slider.setLimits(-val, val)
             try:
-                len = elastic_controller.getTarget()
+                len = self.elastic_controller.getTarget()
                 slider.setValue(len)
             except:
                 pass
@@ -90,41 +105,61 @@ class ElasticSliderBox(QGroupBox):
         range_box.textEdited.connect(rangeTextChange)
         expanded_layout.addRow(QLabel('Slider range'), range_box)
 
-        k_box = QLineEdit(k_str.format(elastic_controller.elastic.k))
+        k_box = self.kBox = QLineEdit()
         def kTextChange():
             try:
                 val = float(k_box.text())
             except:
                 return
             if abs(val) > 0.001:
-                elastic_controller.elastic.k = val
+                post(self.elastic_controller.elastic.setK, val)
         k_box.textEdited.connect(kTextChange)
         expanded_layout.addRow(QLabel('Elastic K'), k_box)
 
-        force_box = QLineEdit(force_str.format(elastic_controller.maxForce))
+        force_box = self.forceBox = QLineEdit()
         def forceTextChange():
             try:
                 val = float(force_box.text())
             except:
                 return
-            elastic_controller.maxForce = val
+            post(self.elastic_controller.setMaxForce, val)
         force_box.textEdited.connect(forceTextChange)
         expanded_layout.addRow(QLabel('Motor Force'), force_box)
 
-        speed_box = QLineEdit(speed_str.format(elastic_controller.maxSpeed))
+        speed_box = self.speedBox = QLineEdit()
         def speedTextChange():
             try:
                 val = float(speed_box.text())
             except:
                 return
-            elastic_controller.maxSpeed = val
+            post(self.elastic_controller.setMaxSpeed, val)
         speed_box.textEdited.connect(speedTextChange)
         expanded_layout.addRow(QLabel('Motor Speed'), speed_box)
 
-
+        self.bind(elastic_controller)
         # Start contracted by default
         self.contract()
 
+    def bind(self, elastic_controller):
+        '''Points the controls at a (new) controller, and resets them to show
+        its settings, so that a box can be reused across scene resets.'''
+        self.elastic_controller = elastic_controller
+        elastic_controller.subscribeChange(self.targetChanged.emit)
+        self.setTitle(elastic_controller.label)
+        fields = (self.slider, self.textBox, self.rangeBox, self.kBox,
+                  self.forceBox, self.speedBox)
+        for widget in fields:
+            widget.blockSignals(True)
+        self.slider.setLimits(-length_range, length_range)
+        self.slider.setValue(elastic_controller.getTarget())
+        self.textBox.setText(length_str.format(elastic_controller.getTarget()))
+        self.rangeBox.setText(length_str.format(length_range))
+        self.kBox.setText(k_str.format(elastic_controller.elastic.k))
+        self.forceBox.setText(force_str.format(elastic_controller.maxForce))
+        self.speedBox.setText(speed_str.format(elastic_controller.maxSpeed))
+        for widget in fields:
+            widget.blockSignals(False)
+
     def toggleExpand(self):
         if self.expanded:
             self.contract()
@@ -144,27 +179,36 @@ class ElasticSliderBox(QGroupBox):
         self.expandWidget.hide()
 
 class ComboSliderBox(QWidget):
-    def __init__(self, label, coupledController):
+    def __init__(self, label, coupledController, post=call):
         super(ComboSliderBox, self).__init__()
         # Slider box
         self.setSizePolicy(QSizePolicy.Minimum, QSizePolicy.Minimum)
         self.setMinimumWidth(170)
         self.setMinimumHeight(40)
         box_layout = QHBoxLayout(self)
-        box_layout.addWidget(QLabel(label))
+        self.label = QLabel()
+        box_layout.addWidget(self.label)
         # The actual slider
-        slider = QSliderD(Qt.Horizontal, divisor=100)
+        slider = self.slider = QSliderD(Qt.Horizontal, divisor=100)
         slider.setLimits(-1, 1)
         def valChange():
-            coupledController.setTarget(slider.value())
+            post(self.coupledController.setTarget, slider.value())
         slider.valueChanged.connect(valChange)
         box_layout.addWidget(slider)
+        self.bind(coupledController, label)
+
+    def bind(self, coupledController, label=None):
+        self.coupledController = coupledController
+        self.label.setText(label or coupledController.label)
+        self.slider.blockSignals(True)
+        self.slider.setValue(coupledController.getTarget())
+        self.slider.blockSignals(False)
 
 class LoadSliderBox(QGroupBox):
-    def __init__(self, label, load):
+    def __init__(self, label, load, post=call):
         super(LoadSliderBox, self).__init__(label)
         # Slider box
-        self.load = load
+        self.load = None
         self.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Minimum)
         self.setFixedWidth(170)
         self.setMinimumHeight(40)
@@ -176,25 +220,26 @@ class LoadSliderBox(QGroupBox):
         box_layout.addWidget(QLabel('Load (N)'))
 
         # The actual slider
-        slider = QSliderD(Qt.Horizontal, divisor=10)
-        slider.setLimits(0, load.max)
+        slider = self.slider = QSliderD(Qt.Horizontal, divisor=10)
         def valChange():
-            load.setForce([0, -slider.value()])
+            post(self.load.setForce, [0, -slider.value()])
+            self.textBox.blockSignals(True)
             self.textBox.setText(force_str.format(slider.value()))
+            self.textBox.blockSignals(False)
         slider.valueChanged.connect(valChange)
         slider.setTickInterval(10)
         slider.setTickPosition(QSlider.TicksBelow)
         expander_stack.addWidget(slider)
 
         # Text readout
-        self.textBox = QLineEdit(force_str.format(0))
+        self.textBox = QLineEdit()
         self.textBox.setMaximumWidth(80)
         def textChange():
             try:
                 val = float(self.textBox.text())
             except:
                 return
-            load.setForce([0, -val])
+            post(self.load.setForce, [0, -val])
             slider.blockSignals(True)
             slider.setValue(val)
             slider.blockSignals(False)
@@ -212,17 +257,17 @@ class LoadSliderBox(QGroupBox):
         self.expandWidget = QWidget()
         expander_stack.addWidget(self.expandWidget)
         expanded_layout = QFormLayout(self.expandWidget)
-        range_box = QLineEdit(length_str.format(load.max))
+        range_box = self.rangeBox = QLineEdit()
         def rangeTextChange():
             try:
                 val = float(range_box.text())
             except:
                 return
-            load.max = val
+            self.load.max = val
             slider.blockSignals(True)
-            slider.setLimits(0, load.max)
+            slider.setLimits(0, self.load.max)
             try:
-                f = -load.force.y
+                f = -self.load.force.y
                 slider.setValue(f)
             except:
                 pass
@@ -230,9 +275,25 @@ class LoadSliderBox(QGroupBox):
         range_box.textEdited.connect(rangeTextChange)
         expanded_layout.addRow(QLabel('Max Load (N)'), range_box)
 
+        self.bind(load, label)
         # Start contracted by default
         self.contract()
 
+    def bind(self, load, label=None):
+        '''Points the controls at a (new) load, and resets them to show its
+        settings.'''
+        self.load = load
+        self.setTitle(label or load.label)
+        fields = (self.slider, self.textBox, self.rangeBox)
+        for widget in fields:
+            widget.blockSignals(True)
+        self.slider.setLimits(0, load.max)
+        self.slider.setValue(-load.force.y)
+        self.textBox.setText(force_str.format(-load.force.y))
+        self.rangeBox.setText(length_str.format(load.max))
+        for widget in fields:
+            widget.blockSignals(False)
+
     def toggleExpand(self):
         if self.expanded:
             self.contract()
@@ -252,8 +313,11 @@ class LoadSliderBox(QGroupBox):
         self.expandWidget.hide()
 
 class ControlPane(QScrollArea):
-    def __init__(self):
+    def __init__(self, post=call):
+        '''Changes to the simulation are made through post(function, *args),
+        so that they can be passed on to wherever the physics runs.'''
         QScrollArea.__init__(self)
+        self.post = post
         self.setWidgetResizable(True)
         self.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Expanding)
 
@@ -265,20 +329,47 @@ class ControlPane(QScrollArea):
         self.layout.setContentsMargins(5,5,5,5)
 
         self.elastics = []
+        # (kind, label) of each box, and the boxes, in order of addition
+        self.controls = []
+        self.boxes = []
 
     def minimumSizeHint(self):
         return QSize(200,0)
 
+    def addBox(self, kind, label, box):
+        self.controls.append((kind, label))
+        self.boxes.append(box)
+        self.layout.addWidget(box)
+
     def addElasticController(self, elastic):
         '''Adds controls for an elastic thread'''
-        slider_box = ElasticSliderBox(elastic)
-        self.layout.addWidget(slider_box)
+        slider_box = ElasticSliderBox(elastic, self.post)
+        self.addBox('elastic', elastic.label, slider_box)
 
     def addComboController(self, label, coupledController):
-        self.layout.addWidget(ComboSliderBox(label, coupledController))
+        self.addBox('combo', label,
+                    ComboSliderBox(label, coupledController, self.post))
 
     def addLoad(self, label, load):
-        self.layout.addWidget(LoadSliderBox(label, load))
+        self.addBox('load', label, LoadSliderBox(label, load, self.post))
+
+    def setControls(self, controls):
+        '''Shows controls for a list of (kind, label, object), where kind is
+        'load', 'elastic' or 'combo'. If the same controls are already shown,
+        as after a scene reset, the existing boxes are rebound to the new
+        objects rather than rebuilt.'''
+        if [(kind, label) for kind, label, obj in controls] == self.controls:
+            for box, (kind, label, obj) in zip(self.boxes, controls):
+                box.bind(obj)
+            return
+        self.clear()
+        for kind, label, obj in controls:
+            if kind == 'load':
+                self.addLoad(label, obj)
+            elif kind == 'elastic':
+                self.addElasticController(obj)
+            else:
+                self.addComboController(label, obj)
 
     def clear(self):
         while self.layout.count() > 0:
@@ -289,3 +380,5 @@ class ControlPane(QScrollArea):
             if w:
                 w.deleteLater()
         self.layout.addStretch(1)
+        self.controls = []
+        self.boxes = []
@@ -0,0 +1,250 @@
+'''Reinforcement learning environments around the headless simulator.
+
+    env = SimulationEnv('finger.yml', max_steps=200)
+    observation = env.reset()
+    observation, reward, done, info = env.step(action)
+
+The scene is built and settled once; reset restores that settled state from
+a Checkpoint. Actions are targets for the scene's controllers, and
+observations are joint angles, tendon lengths and tendon tensions, as one
+numpy array. VectorEnv runs many environments on worker processes, which
+write their observations straight into shared memory.
+'''
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from senesim.config import *
+from senesim.scene import Elastic
+from senesim.simulation import Simulation
+from senesim.equilibrium import runUntilRest
+
+
+class SimulationEnv(object):
+    '''One simulated scene, stepped by actions.
+
+    Actions set the targets of the actuators: the coupled controllers
+    (targets in [-1, 1]) or the tendon controllers (positions within their
+    limits). By default the coupled controllers are used if the scene has
+    any. Each step then advances substeps substeps. Observations are, in
+    order, the angle of each joint, and the length and tension of each
+    elastic (in scene units), from observationSlices.
+
+    reward, if given, is called with the environment after each step and
+    returns its reward; it must be picklable for VectorEnv. Episodes end
+    after max_steps steps, if given.'''
+
+    def __init__(self, filePath, substeps=world_outer_iterations,
+                 delta_t=1 / world_fps, actuators='auto', reward=None,
+                 max_steps=None, settle_steps=4000):
+        self.sim = Simulation()
+        self.sim.load(filePath)
+        self.substeps = substeps
+        self.delta_t = delta_t
+        self.reward = reward
+        self.maxSteps = max_steps
+        self.elastics = [c for c in self.sim.constraints
+                         if isinstance(c, Elastic)]
+        if actuators == 'auto':
+            actuators = 'coupled' if self.sim.coupledControllers else 'tendon'
+        if actuators == 'coupled':
+            self.actuators = list(self.sim.coupledControllers)
+            self.actionLow = -np.ones(len(self.actuators))
+            self.actionHigh = np.ones(len(self.actuators))
+        elif actuators == 'tendon':
+            self.actuators = list(self.sim.controllers)
+            self.actionHigh = np.array([c.limit for c in self.actuators],
+                                       dtype=float)
+            self.actionLow = -self.actionHigh
+        else:
+            raise Exception('Unknown actuators {0}'.format(actuators))
+        joints = len(self.sim.joints)
+        elastics = len(self.elastics)
+        self.observationSlices = {
+            'angles': slice(0, joints),
+            'lengths': slice(joints, joints + elastics),
+            'tensions': slice(joints + elastics, joints + 2 * elastics),
+        }
+        self.actionSize = len(self.actuators)
+        self.observationSize = joints + 2 * elastics
+        self.steps = 0
+        self.settle(settle_steps)
+        self.initialState = self.sim.checkpoint()
+
+    def settle(self, max_substeps):
+        '''Runs the scene until it comes to rest, or for max_substeps.'''
+        runUntilRest(self.sim, max_substeps, self.delta_t)
+
+    def reset(self, out=None):
+        '''Returns to the settled state, and returns its observation.'''
+        self.sim.restore(self.initialState)
+        self.steps = 0
+        return self.observe(out)
+
+    def step(self, action, out=None):
+        '''Applies an action, advances the scene, and returns (observation,
+        reward, done, info).'''
+        for actuator, target in zip(self.actuators, action):
+            actuator.setTarget(float(target))
+        self.sim.advance(self.substeps, self.delta_t)
+        self.steps += 1
+        observation = self.observe(out)
+        reward = 0.0 if self.reward is None else self.reward(self)
+        done = self.maxSteps is not None and self.steps >= self.maxSteps
+        return observation, reward, done, {}
+
+    def observe(self, out=None):
+        '''Writes the current observation into out (a new array if None),
+        and returns it.'''
+        if out is None:
+            out = np.empty(self.observationSize)
+        slices = self.observationSlices
+        out[slices['angles']] = [joint.angle for joint in self.sim.joints]
+        out[slices['lengths']] = [e.getLength() for e in self.elastics]
+        out[slices['tensions']] = [e.getInternalForce(self.delta_t)
+                                   for e in self.elastics]
+        return out
+
+
+def runEnvWorker(connection, memory, shape, first, filePath, options):
+    '''Worker process for VectorEnv: runs environments first, first + 1, ...
+    and serves commands from connection, with observations, actions,
+    rewards and done flags in shared memory.'''
+    block = shared_memory.SharedMemory(name=memory)
+    buffers = VectorEnv.mapBuffers(block.buf, shape)
+    observations, actions, rewards, dones = buffers
+    try:
+        count = connection.recv()
+        envs = [SimulationEnv(filePath, **options) for i in range(count)]
+        connection.send(None)
+        rows = range(first, first + count)
+        while True:
+            command = connection.recv()
+            if command == 'step':
+                for i, env in zip(rows, envs):
+                    observation, reward, done, info = env.step(
+                        actions[i], out=observations[i])
+                    rewards[i] = reward
+                    dones[i] = done
+                    # Finished episodes start again at once, as gym's
+                    # vector environments do
+                    if done:
+                        env.reset(out=observations[i])
+            elif command == 'reset':
+                for i, env in zip(rows, envs):
+                    env.reset(out=observations[i])
+            elif command == 'close':
+                break
+            connection.send(None)
+    finally:
+        del observations, actions, rewards, dones, buffers
+        block.close()
+
+
+class VectorEnv(object):
+    '''n SimulationEnvs of the same scene, stepped together on worker
+    processes (one per core by default). Observations, actions, rewards and
+    done flags live in one block of shared memory, so stepping only sends a
+    command to each worker; the arrays returned by reset and step are views
+    of it, overwritten by the next call.
+
+    Environments whose episode ends are reset straight away, and the
+    observation returned for them is the first of the new episode.'''
+
+    def __init__(self, filePath, n, processes=None, **options):
+        self.n = n
+        probe = SimulationEnv(filePath, **dict(options, settle_steps=0))
+        self.actionSize = probe.actionSize
+        self.observationSize = probe.observationSize
+        self.observationSlices = probe.observationSlices
+        self.actionLow = probe.actionLow
+        self.actionHigh = probe.actionHigh
+        del probe
+        shape = (n, self.observationSize, self.actionSize)
+        self.memory = shared_memory.SharedMemory(
+            create=True, size=self.getBufferSize(shape))
+        (self.observations, self.actions, self.rewards,
+         self.dones) = self.mapBuffers(self.memory.buf, shape)
+        processes = min(processes or os.cpu_count(), n)
+        context = multiprocessing.get_context('spawn')
+        self.connections = []
+        self.workers = []
+        first = 0
+        for p in range(processes):
+            count = n // processes + (p < n % processes)
+            parent, child = context.Pipe()
+            worker = context.Process(
+                target=runEnvWorker, daemon=True,
+                args=(child, self.memory.name, shape, first, filePath,
+                      options))
+            worker.start()
+            # So that the pipe breaks, rather than hangs, if a worker dies
+            child.close()
+            parent.send(count)
+            self.connections.append(parent)
+            self.workers.append(worker)
+            first += count
+        self.wait()
+
+    @staticmethod
+    def getBufferSize(shape):
+        n, observation_size, action_size = shape
+        return 8 * n * (observation_size + action_size + 2)
+
+    @staticmethod
+    def mapBuffers(buffer, shape):
+        '''Returns the observations, actions, rewards and done flags arrays,
+        laid out in a shared buffer.'''
+        n, observation_size, action_size = shape
+        sizes = [n * observation_size, n * action_size, n, n]
+        arrays = []
+        offset = 0
+        for size in sizes:
+            arrays.append(np.ndarray((size,), dtype=np.float64,
+                                     buffer=buffer, offset=offset))
+            offset += 8 * size
+        observations, actions, rewards, dones = arrays
+        return (observations.reshape(n, observation_size),
+                actions.reshape(n, action_size), rewards, dones)
+
+    def command(self, name):
+        for connection in self.connections:
+            connection.send(name)
+        self.wait()
+
+    def wait(self):
+        for connection in self.connections:
+            connection.recv()
+
+    def reset(self):
+        '''Resets every environment. Returns the observations, one row per
+        environment.'''
+        self.command('reset')
+        return self.observations
+
+    def step(self, actions):
+        '''Steps every environment with its row of actions. Returns
+        (observations, rewards, dones, info).'''
+        self.actions[:] = actions
+        self.command('step')
+        return self.observations, self.rewards, self.dones.astype(bool), {}
+
+    def close(self):
+        if self.memory is None:
+            return
+        for connection in self.connections:
+            connection.send('close')
+        for worker in self.workers:
+            worker.join()
+        del self.observations, self.actions, self.rewards, self.dones
+        self.memory.close()
+        self.memory.unlink()
+        self.memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,579 @@
+'''Quasi-static equilibrium: finds the resting configuration of a scene
+directly, instead of stepping it until it stops moving.
+
+    sim = Simulation('finger.yml')
+    sim.tendonControllers['upper-elastic'].setTarget(-20)
+    solveEquilibrium(sim)
+
+Bodies are grouped into independent components (bodies linked by joints,
+elastics or loads). Each component is posed by its joint angles, from the
+static bodies outwards; bodies not jointed to anything static are posed
+freely. A Newton iteration then finds the pose where the static elastic
+tensions (through their routed paths, as Elastic applies them), loads and
+gravity balance at every joint, with joint limits taking up what pushes
+against them. Tendon controllers are at their targets, or reeled out to
+their maximum force.
+
+Contacts are not modelled. Components that touch other bodies, are jointed
+in loops, or have driven joint motors, and components that don't converge
+to a stable pose, are left to ordinary stepping instead. Joint motors that
+aren't driven hold their joints by friction.
+
+Where friction or joint limits hold a joint, there is a range of poses it
+can rest in, and which one stepping reaches depends on how it got there:
+the solver, which takes no account of that, can find another. So
+solveEquilibrium steps the scene until its controllers have stopped moving,
+solves from there, and keeps the solved pose only if a short stretch of
+stepping from the same point agrees with it; otherwise stepping carries on
+to rest. The poses it returns are at rest, and solved ones match where
+stepping comes to rest except at joint limits: Box2D only corrects a limit
+once it is passed by more than b2_angularSlop (two degrees), so a stepped
+joint pushed against its limit rests up to that far beyond it, where the
+solved one sits on it.
+
+For stepped simulations, RestDetector tells when they have come to rest,
+and runUntilRest steps one until it does.
+'''
+import math
+
+from Box2D import *
+
+from senesim.config import *
+from senesim.rootfind import brentq
+from senesim.scene import Elastic
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class Component(object):
+    '''Bodies that move together, and the coordinates that pose them: one
+    per revolute joint (its angle), and three (x, y, angle) per body that
+    isn't jointed to a static body.'''
+
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.joints = []
+        self.elastics = []
+        self.loads = []
+        # Per coordinate: ('joint', joint) or ('free', body, axis)
+        self.coordinates = []
+        self.lower = []
+        self.upper = []
+        # Per coordinate, the torque its joint's motor holds it with
+        self.friction = []
+        # (parent, joint, child, parent is bodyA, coordinate), parents
+        # before children
+        self.links = []
+        # Free bodies, and their first coordinate
+        self.roots = []
+
+    def build(self):
+        '''Orders the bodies into trees, out from static bodies or, failing
+        that, from free bodies. Returns False for scenes it can't pose:
+        jointed in loops, or with driven joint motors. Motors that aren't
+        driven (motorSpeed 0) are friction, up to maxMotorTorque.'''
+        members = set(self.bodies)
+        neighbours = {body: [] for body in self.bodies}
+        queue = []
+        for joint in self.joints:
+            if joint.motorEnabled and joint.motorSpeed != 0:
+                return False
+            a = joint.bodyA
+            b = joint.bodyB
+            if a in members and b in members:
+                neighbours[a].append((joint, b, True))
+                neighbours[b].append((joint, a, False))
+            elif b in members:
+                queue.append((a, joint, b, True))
+            else:
+                queue.append((b, joint, a, False))
+        used = set(joint for parent, joint, child, parentIsA in queue)
+        placed = set()
+        remaining = list(self.bodies)
+        while queue or remaining:
+            if queue:
+                parent, joint, body, parentIsA = queue.pop(0)
+                if body in placed:
+                    return False
+                self.links.append((parent, joint, body, parentIsA,
+                                   len(self.coordinates)))
+                self.coordinates.append(('joint', joint))
+                if joint.limitEnabled:
+                    self.lower.append(joint.lowerLimit)
+                    self.upper.append(joint.upperLimit)
+                else:
+                    self.lower.append(-math.inf)
+                    self.upper.append(math.inf)
+                self.friction.append(joint.GetMaxMotorTorque()
+                                     if joint.motorEnabled else 0.0)
+            else:
+                body = remaining.pop(0)
+                if body in placed:
+                    continue
+                self.roots.append((body, len(self.coordinates)))
+                for axis in range(3):
+                    self.coordinates.append(('free', body, axis))
+                    self.lower.append(-math.inf)
+                    self.upper.append(math.inf)
+                    self.friction.append(0.0)
+            placed.add(body)
+            for joint, other, parentIsA in neighbours[body]:
+                if joint not in used:
+                    used.add(joint)
+                    queue.append((body, joint, other, parentIsA))
+        self.lower = np.array(self.lower)
+        self.upper = np.array(self.upper)
+        self.friction = np.array(self.friction)
+        return True
+
+    def getCoordinates(self):
+        q = []
+        for coordinate in self.coordinates:
+            if coordinate[0] == 'joint':
+                q.append(coordinate[1].angle)
+            else:
+                kind, body, axis = coordinate
+                q.append((body.position.x, body.position.y, body.angle)[axis])
+        return np.array(q)
+
+    def setCoordinates(self, q):
+        '''Poses the bodies, parents before children.'''
+        for body, first in self.roots:
+            body.transform = ((q[first], q[first + 1]), q[first + 2])
+        for parent, joint, child, parentIsA, n in self.links:
+            reference = joint.GetReferenceAngle()
+            if parentIsA:
+                angle = parent.angle + reference + q[n]
+                anchor = parent.GetWorldPoint(joint.GetLocalAnchorA())
+                local = joint.GetLocalAnchorB()
+            else:
+                angle = parent.angle - reference - q[n]
+                anchor = parent.GetWorldPoint(joint.GetLocalAnchorB())
+                local = joint.GetLocalAnchorA()
+            c = math.cos(angle)
+            s = math.sin(angle)
+            child.transform = ((anchor.x - c * local.x + s * local.y,
+                                anchor.y - s * local.x - c * local.y), angle)
+        for elastic, controller in self.elastics:
+            elastic.invalidateGeometry()
+
+    def getGeneralizedForces(self, q, gravity):
+        '''The generalized forces at pose q: for each joint, the torque about
+        it on everything beyond it; for each free body, the force and torque
+        on it and everything jointed to it.'''
+        self.setCoordinates(q)
+        # Per body: net force, and its moment about the world origin
+        totals = {body: [0.0, 0.0, 0.0] for body in self.bodies}
+
+        def apply(body, point, force):
+            total = totals.get(body)
+            if total is not None:
+                total[0] += force[0]
+                total[1] += force[1]
+                total[2] += point[0] * force[1] - point[1] * force[0]
+
+        for body in self.bodies:
+            weight = gravity * (body.mass * body.gravityScale)
+            apply(body, body.worldCenter, weight)
+        for load in self.loads:
+            apply(load.body, load.body.GetWorldPoint(load.anchor), load.force)
+        for elastic, controller in self.elastics:
+            tension = getStaticTension(elastic, controller)
+            if tension == 0:
+                continue
+            points, forces = elastic.getForces(tension)
+            for body, point, force in zip(elastic.getBodies(), points,
+                                          forces):
+                apply(body, point, force)
+        # Sum over subtrees, children before parents
+        for parent, joint, child, parentIsA, n in reversed(self.links):
+            total = totals.get(parent)
+            if total is not None:
+                for i, value in enumerate(totals[child]):
+                    total[i] += value
+        forces = np.empty(len(self.coordinates))
+        for parent, joint, child, parentIsA, n in self.links:
+            fx, fy, moment = totals[child]
+            anchor = joint.anchorA
+            torque = moment - (anchor.x * fy - anchor.y * fx)
+            forces[n] = torque if parentIsA else -torque
+        for body, first in self.roots:
+            fx, fy, moment = totals[body]
+            origin = body.position
+            forces[first] = fx
+            forces[first + 1] = fy
+            forces[first + 2] = moment - (origin.x * fy - origin.y * fx)
+        return forces
+
+
+def getStaticTension(elastic, controller):
+    '''The tension of an elastic at rest: with its controller, if any, at its
+    target, or reeled out as far as it has to be to keep within its maximum
+    force (see TendonController.update).'''
+    if controller is None:
+        return elastic.getStaticTension(elastic.getExtension())
+    length = elastic.getLength()
+    tension = elastic.getStaticTension(
+        length - controller.rest - controller.target)
+    if tension > controller.maxForce:
+        tension = max(controller.maxForce, elastic.getStaticTension(
+            length - controller.rest - controller.limit))
+    return tension
+
+
+def getRestPosition(elastic, controller):
+    '''The controller position that goes with getStaticTension.'''
+    length = elastic.getLength()
+
+    def excessForce(position):
+        return (elastic.getStaticTension(length - controller.rest - position) -
+                controller.maxForce)
+
+    if excessForce(controller.target) <= 0:
+        return controller.target
+    if excessForce(controller.limit) >= 0:
+        return controller.limit
+    return brentq(excessForce, controller.target, controller.limit,
+                  xtol=1e-9)
+
+
+class EquilibriumSolver(object):
+    '''Solves each component of a simulation for its equilibrium pose (see
+    the module docstring). After solve, solved holds the components that
+    converged, which are left at rest in their equilibrium pose, and failed
+    those left as they were.'''
+
+    available = np is not None
+
+    def __init__(self, sim, tolerance=equilibrium_tolerance,
+                 max_iterations=equilibrium_max_iterations):
+        self.sim = sim
+        self.tolerance = tolerance
+        self.maxIterations = max_iterations
+        self.gravity = np.array(tuple(sim.world.gravity))
+        self.components = self.findComponents()
+        self.solved = []
+        self.failed = []
+
+    def findComponents(self):
+        '''Groups the dynamic bodies that joints and elastics tie together,
+        with the joints, elastics and loads acting on each group.'''
+        sim = self.sim
+        dynamic = [body.body for body in sim.bodies if not body.static]
+        groups = {body: [body] for body in dynamic}
+
+        def join(bodies):
+            bodies = [b for b in bodies if b in groups]
+            if not bodies:
+                return
+            group = groups[bodies[0]]
+            for body in bodies[1:]:
+                other = groups[body]
+                if other is not group:
+                    group.extend(other)
+                    for member in other:
+                        groups[member] = group
+
+        joints = [j for j in sim.joints if j.bodyA in groups or
+                  j.bodyB in groups]
+        for joint in joints:
+            join([joint.bodyA, joint.bodyB])
+        elastics = [c for c in sim.constraints if isinstance(c, Elastic)]
+        for elastic in elastics:
+            join(elastic.getBodies())
+        order = {body: n for n, body in enumerate(dynamic)}
+        components = {}
+        for body in dynamic:
+            group = groups[body]
+            if id(group) not in components:
+                components[id(group)] = Component(
+                    sorted(group, key=order.get))
+        byBody = {body: component for component in components.values()
+                  for body in component.bodies}
+        controllers = {c.elastic: c for c in sim.controllers}
+        for elastic in elastics:
+            for body in elastic.getBodies():
+                if body in byBody:
+                    byBody[body].elastics.append(
+                        (elastic, controllers.get(elastic)))
+                    break
+        for joint in joints:
+            body = joint.bodyA if joint.bodyA in byBody else joint.bodyB
+            byBody[body].joints.append(joint)
+        for load in sim.loads:
+            if load.body in byBody:
+                byBody[load.body].loads.append(load)
+        return list(components.values())
+
+    def solve(self):
+        '''Solves every component. Returns True if all of them converged.'''
+        self.solved = []
+        self.failed = []
+        for component in self.components:
+            if self.solveComponent(component):
+                self.solved.append(component)
+            else:
+                self.failed.append(component)
+        self.sim.world.ClearForces()
+        self.sim.invalidateGeometry()
+        self.sim.invalidateControllers()
+        # Joint impulses from before the jump must not be warm started
+        self.sim.coldStart = True
+        return not self.failed
+
+    def solveComponent(self, component):
+        if not component.build() or isTouching(component):
+            return False
+        start = component.getCoordinates()
+        q = self.findRoot(component, start)
+        if q is None:
+            component.setCoordinates(start)
+            return False
+        component.setCoordinates(q)
+        if isTouching(component):
+            component.setCoordinates(start)
+            return False
+        for body in component.bodies:
+            body.linearVelocity = (0, 0)
+            body.angularVelocity = 0
+            body.awake = True
+        for elastic, controller in component.elastics:
+            if controller is not None:
+                controller.position = getRestPosition(elastic, controller)
+                elastic.setRestLength(controller.rest + controller.position)
+            # So that damping starts from rest
+            elastic.last_extension = elastic.getExtension()
+            elastic.appliedForces = None
+        return True
+
+    def findRoot(self, component, q):
+        '''Pseudo-transient continuation on the generalized forces, within
+        joint limits and motor friction: each step solves (shift - J) dq = Q,
+        where J is the Jacobian of the forces Q. A large shift follows the
+        forces, as the bodies would move; the shift falls as the forces do,
+        becoming Newton's method near the equilibrium. Steps that raise the
+        forces are retried with a larger shift, until the shift outweighs J
+        and the step simply follows the forces. This finds a stable
+        equilibrium near the starting pose, rather than any root of Q.
+        Returns the pose, or None if it doesn't converge.'''
+        lower = component.lower
+        upper = component.upper
+        friction = component.friction
+
+        def evaluate(q):
+            forces = component.getGeneralizedForces(q, self.gravity)
+            # Limits take up forces pushing against them, and joint motors
+            # hold against torques within their maximum
+            free = ~(((q <= lower) & (forces < 0)) |
+                     ((q >= upper) & (forces > 0)) |
+                     (np.abs(forces) <= friction))
+            return forces, free, np.abs(forces[free]).max(initial=0)
+
+        q = np.clip(q, lower, upper)
+        forces, free, error = evaluate(q)
+        shift = None
+        iterations = 0
+        while iterations < self.maxIterations:
+            jacobian = self.getJacobian(component, q, forces)[free][:, free]
+            iterations += 1
+            if error >= self.tolerance:
+                # Stiff elastics can leave forces above tolerance from the
+                # rounding of body positions alone; then it's enough that
+                # Newton's method would barely move
+                try:
+                    newton = np.linalg.solve(jacobian, forces[free])
+                    if np.abs(newton).max() < equilibrium_step_tolerance:
+                        error = 0
+                except np.linalg.LinAlgError:
+                    pass
+            stiffness = np.abs(jacobian).sum(axis=1).max(initial=0)
+            if error < self.tolerance:
+                # Stable if no small disturbance is pushed further, allowing
+                # for neutral directions (a free body's spin, slack tendons)
+                # and the error of the differences
+                if len(jacobian) and np.linalg.eigvals(
+                        jacobian).real.max() > 0.01 * stiffness:
+                    return None
+                return q
+            if stiffness == 0:
+                # Nothing pushes back: the component falls freely
+                return None
+            if shift is None:
+                shift = stiffness
+            identity = np.eye(len(jacobian))
+            while iterations < self.maxIterations:
+                iterations += 1
+                try:
+                    step = np.linalg.solve(shift * identity - jacobian,
+                                           forces[free])
+                except np.linalg.LinAlgError:
+                    shift *= 4
+                    continue
+                # Move no more than equilibrium_max_step at once
+                largest = np.abs(step).max()
+                if largest > equilibrium_max_step:
+                    step *= equilibrium_max_step / largest
+                trial = q.copy()
+                trial[free] += step
+                trial = np.clip(trial, lower, upper)
+                trialForces, trialFree, trialError = evaluate(trial)
+                if trialError < error or shift >= stiffness:
+                    shift *= min(trialError / error, 0.5)
+                    break
+                shift *= 4
+            else:
+                return None
+            q, forces, free, error = trial, trialForces, trialFree, trialError
+        return None
+
+    def getJacobian(self, component, q, forces):
+        '''Derivatives of the generalized forces, by forward differences.'''
+        n = len(q)
+        jacobian = np.empty((n, n))
+        for i in range(n):
+            h = equilibrium_difference_step
+            # Step away from a bound, if up against one
+            if q[i] + h > component.upper[i]:
+                h = -h
+            shifted = q.copy()
+            shifted[i] += h
+            jacobian[:, i] = (component.getGeneralizedForces(
+                shifted, self.gravity) - forces) / h
+        component.setCoordinates(q)
+        return jacobian
+
+
+def isAtRest(sim, linear=settle_linear_velocity,
+             angular=settle_angular_velocity):
+    for body in sim.world.bodies:
+        if not body.awake:
+            continue
+        if (body.linearVelocity.length > linear or
+                abs(body.angularVelocity) > angular):
+            return False
+    return True
+
+
+class RestDetector(object):
+    '''Tells when a stepped simulation has come to rest, from checks made
+    once per frame. A frame is still if every awake body is within the
+    settle velocities, the total kinetic energy is within
+    settle_kinetic_energy, and no elastic's tension (at rest, without
+    damping) or tendon controller's position changed by more than
+    settle_tension_change or settle_position_change since the last check.
+    The simulation is at rest after settle_frames still frames in a row.'''
+
+    def __init__(self, sim, frames=settle_frames):
+        self.sim = sim
+        self.frames = frames
+        self.elastics = [c for c in sim.constraints if isinstance(c, Elastic)]
+        self.reset()
+
+    def reset(self):
+        '''Starts counting still frames again, e.g. after an input changed.'''
+        self.still = False
+        self.count = 0
+        self.tensions = None
+        self.positions = None
+
+    def getKineticEnergy(self):
+        energy = 0.0
+        for body in self.sim.world.bodies:
+            if body.awake:
+                v = body.linearVelocity
+                energy += 0.5 * (body.mass * (v.x * v.x + v.y * v.y) +
+                                 body.inertia * body.angularVelocity ** 2)
+        return energy
+
+    def update(self):
+        '''Checks the simulation after a frame. Returns whether it is at
+        rest.'''
+        tensions = [e.getStaticTension(e.getExtension())
+                    for e in self.elastics]
+        positions = [c.position for c in self.sim.controllers]
+        still = (self.tensions is not None and
+                 isAtRest(self.sim) and
+                 self.getKineticEnergy() <= settle_kinetic_energy and
+                 all(abs(a - b) <= settle_tension_change
+                     for a, b in zip(tensions, self.tensions)) and
+                 all(abs(a - b) <= settle_position_change
+                     for a, b in zip(positions, self.positions)))
+        self.tensions = tensions
+        self.positions = positions
+        self.still = still
+        self.count = self.count + 1 if still else 0
+        return self.count >= self.frames
+
+
+def runUntilRest(sim, max_substeps, delta_t=1 / world_fps):
+    '''Runs the simulation a frame at a time until a RestDetector finds it
+    at rest, or for max_substeps. Returns the substep at which it last
+    became still, or None if it didn't come to rest.'''
+    detector = RestDetector(sim)
+    settled_at = None
+    step = 0
+    while step < max_substeps:
+        n = min(world_outer_iterations, max_substeps - step)
+        sim.advance(n, delta_t)
+        step += n
+        atRest = detector.update()
+        if not detector.still:
+            settled_at = None
+        elif settled_at is None:
+            settled_at = step
+        if atRest:
+            return settled_at
+    return None
+
+
+def isTouching(component):
+    '''Whether any body of a component is in contact with another body.'''
+    return any(edge.contact.touching
+               for body in component.bodies for edge in body.contacts)
+
+
+def rampControllers(sim, max_substeps):
+    '''Steps the simulation a frame at a time until no tendon controller
+    moves any more (they move towards their targets at maxSpeed), or for
+    max_substeps. Returns the number of substeps run.'''
+    step = 0
+    while step < max_substeps:
+        positions = [c.position for c in sim.controllers]
+        n = min(world_outer_iterations, max_substeps - step)
+        sim.advance(n)
+        step += n
+        if all(c.position == p for c, p in zip(sim.controllers, positions)):
+            break
+    return step
+
+
+def solveEquilibrium(sim, max_substeps=equilibrium_settle_steps,
+                     check=equilibrium_check_steps,
+                     tolerance=equilibrium_check_tolerance):
+    '''Brings a simulation to rest, and returns whether it got there within
+    max_substeps. Once its controllers have stopped moving, the pose is
+    solved for directly, and stepped on for check substeps from there as
+    well: where the solved coordinates are within b2_angularSlop plus
+    tolerance of the stepped ones, the solved pose is kept. Otherwise, and
+    where the solver fails, stepping carries on until it comes to rest.'''
+    step = rampControllers(sim, max_substeps)
+    if EquilibriumSolver.available:
+        before = sim.checkpoint()
+        solver = EquilibriumSolver(sim)
+        solved = solver.solve() and sim.checkpoint()
+        poses = [c.getCoordinates() for c in solver.solved]
+        # Components that did solve have moved, failed or not
+        sim.restore(before)
+        if solved:
+            n = min(check, max_substeps - step)
+            sim.advance(n)
+            step += n
+            if all(np.max(np.abs(c.getCoordinates() - q), initial=0) <=
+                   b2_angularSlop + tolerance
+                   for c, q in zip(solver.solved, poses)):
+                sim.restore(solved)
+                return True
+    return runUntilRest(sim, max_substeps - step) is not None
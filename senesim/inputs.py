@@ -0,0 +1,212 @@
+'''Input recordings: the changes made to a simulation while it runs, each
+with the substep at which it took effect, replayed headless at full speed
+(see senesim.replay).
+
+The window records inputs (tendon and coupled controller targets, controller
+and elastic settings from the control pane, loads and mouse drags) from a
+freshly loaded scene, so a replay that rebuilds the scene and makes the same
+calls at the same substeps runs the same simulation, bit for bit. This holds
+for fixed substeps; adaptive steps don't stop at the recorded substeps.
+
+The file is JSON lines: a header naming the scene, then one line per input,
+then a last line with the substep at which recording stopped.
+'''
+import json
+
+from Box2D import *
+
+from senesim.config import *
+from senesim.recording import RecordWriter, getElastics
+
+# The only methods that are recorded, and the only ones a replay will call
+input_methods = {'setTarget', 'setLimit', 'setMaxForce', 'setMaxSpeed',
+                 'setK', 'setForce', 'setForceMagnitude', 'grab', 'grabBody',
+                 'move', 'release'}
+
+
+class BodyQuery(b2QueryCallback):
+    '''Finds a dynamic body whose fixtures contain a world point.'''
+
+    def __init__(self, point):
+        super(BodyQuery, self).__init__()
+        self.point = b2Vec2(point)
+        self.body = None
+
+    def ReportFixture(self, fixture):
+        if (fixture.body.type == b2_dynamicBody and
+                fixture.TestPoint(self.point)):
+            self.body = fixture.body
+            return False
+        return True
+
+
+class DragJoint(object):
+    '''The physics side of dragging a body with the mouse: a mouse joint from
+    the ground to the dragged body, pulled towards a target point. Bodies are
+    given by index in sim.bodies and points in world units, so that drags
+    can be recorded and replayed.'''
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.joint = None
+        self.body = None
+        self.startPt = None
+
+    def findBody(self, point):
+        '''Returns the dynamic Box2D body at a world point, or None.'''
+        query = BodyQuery(point)
+        aabb = b2AABB(lowerBound=(point[0] - 1e-3, point[1] - 1e-3),
+                      upperBound=(point[0] + 1e-3, point[1] + 1e-3))
+        self.sim.world.QueryAABB(query, aabb)
+        return query.body
+
+    def grab(self, target):
+        '''Starts dragging the body at target, if there is one.'''
+        if self.joint:
+            return
+        body = self.findBody(target)
+        if body is not None:
+            self.body = body
+            self.createJoint(target)
+
+    def grabBody(self, index, target):
+        '''Starts dragging sim.bodies[index] by the point target.'''
+        if self.joint:
+            return
+        self.body = self.sim.bodies[index].body
+        self.createJoint(target)
+
+    def createJoint(self, target):
+        self.joint = self.sim.world.CreateMouseJoint(
+            bodyA=self.sim.groundBody.body,
+            bodyB=self.body,
+            target=target,
+            maxForce=8000,
+            collideConnected=True)
+        self.body.awake = True
+        self.startPt = self.body.GetLocalPoint(target)
+
+    def move(self, target):
+        if self.joint:
+            self.joint.target = target
+
+    def release(self):
+        if self.joint:
+            self.sim.world.DestroyJoint(self.joint)
+            self.joint = None
+
+
+def getInputTargets(sim, drag=None):
+    '''Names the objects of a simulation that take inputs: controllers,
+    coupled controllers, loads and elastics by index, and the drag joint.'''
+    targets = {}
+    for n, controller in enumerate(sim.controllers):
+        targets['controller.{0}'.format(n)] = controller
+    for n, controller in enumerate(sim.coupledControllers):
+        targets['coupled.{0}'.format(n)] = controller
+    for n, load in enumerate(sim.loads):
+        targets['load.{0}'.format(n)] = load
+    for n, elastic in enumerate(getElastics(sim)):
+        targets['elastic.{0}'.format(n)] = elastic
+    if drag is not None:
+        targets['drag'] = drag
+    return targets
+
+
+def toJson(value):
+    '''Arguments as JSON values; Box2D vectors and tuples become lists.'''
+    if isinstance(value, (b2Vec2, tuple, list)):
+        return [toJson(v) for v in value]
+    return value
+
+
+class InputRecorder(object):
+    '''Writes the inputs made to a simulation to a file. Posted calls are
+    passed through apply, on the thread that runs the simulation, so that
+    each is recorded with the substep it takes effect at; calls that aren't
+    inputs are made without being recorded.'''
+
+    def __init__(self, sim, path, drag=None):
+        self.sim = sim
+        self.path = path
+        self.names = {obj: name
+                      for name, obj in getInputTargets(sim, drag).items()}
+        self.file = RecordWriter(path, 'w')
+        self.write({'scene': sim.filePath, 'delta_t': 1 / world_fps,
+                    'step': sim.step_n})
+        self.inputs = 0
+
+    def write(self, line):
+        self.file.write(json.dumps(line) + '\n')
+
+    def apply(self, function, *args):
+        '''Makes a posted call, recording it first if it is an input.'''
+        name = self.names.get(getattr(function, '__self__', None))
+        if (self.file and name is not None and
+                function.__name__ in input_methods):
+            self.write({'step': self.sim.step_n, 'target': name,
+                        'method': function.__name__,
+                        'args': [toJson(arg) for arg in args]})
+            self.inputs += 1
+        function(*args)
+
+    def close(self):
+        if self.file:
+            self.write({'step': self.sim.step_n, 'end': True})
+            self.file.close()
+            self.file = None
+
+
+class InputLog(object):
+    '''A recording of inputs, read back: the scene, the recorded inputs as
+    (step, target, method, args), and the substep recording stopped at (or
+    the last input's, if it never stopped cleanly).'''
+
+    def __init__(self, path):
+        with open(path) as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        if not lines or 'scene' not in lines[0]:
+            raise Exception('{0} is not an input recording'.format(path))
+        header = lines[0]
+        self.path = path
+        self.scene = header['scene']
+        self.delta_t = header['delta_t']
+        self.start = header['step']
+        self.inputs = [(line['step'], line['target'], line['method'],
+                        line['args'])
+                       for line in lines[1:] if 'target' in line]
+        ends = [line['step'] for line in lines[1:] if line.get('end')]
+        if ends:
+            self.end = ends[-1]
+        elif self.inputs:
+            self.end = self.inputs[-1][0]
+        else:
+            self.end = self.start
+
+    def __len__(self):
+        return len(self.inputs)
+
+
+def advanceTo(sim, step, delta_t):
+    '''Runs sim up to the given substep, a frame at a time.'''
+    while sim.step_n < step:
+        sim.advance(min(world_outer_iterations, step - sim.step_n), delta_t)
+
+
+def replayInputs(sim, log, steps=None):
+    '''Replays an InputLog into a simulation freshly built from its scene,
+    headless and as fast as it goes: the simulation runs up to each input's
+    substep, and the input is made there. It then runs on up to steps
+    substeps in all (by default, the substep recording stopped at).'''
+    if sim.step_n != log.start:
+        raise Exception('Replays must start at substep {0}, not {1}'.format(
+            log.start, sim.step_n))
+    drag = DragJoint(sim)
+    targets = getInputTargets(sim, drag)
+    for step, target, method, args in log.inputs:
+        if target not in targets or method not in input_methods:
+            raise Exception('Cannot replay {0}.{1}'.format(target, method))
+        advanceTo(sim, step, log.delta_t)
+        getattr(targets[target], method)(*args)
+    advanceTo(sim, log.end if steps is None else steps, log.delta_t)
+    return sim
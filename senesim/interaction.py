@@ -4,88 +4,116 @@ from PyQt5.QtGui import *
 
 from Box2D import *
 
-from senesim import *
 from senesim.config import *
-from senesim.scene import *
+from senesim.scene.label import Label
+from senesim.inputs import DragJoint
 
 
 class MouseDrag(object):
+    '''Drags bodies with the mouse. The joint itself is a DragJoint, changed
+    only through the window's post, like any other input.'''
 
     def __init__(self, app):
         self.app = app
-        self.world = app.world
         self.view = app.view
         self.scene = app.scene
         self.groundBody = app.groundBody
+        self.drag = DragJoint(app.sim)
         self.label = None
-        self.joint = None
         self.target = None
         self.line = None
         self.p = None
         self.mouseDrag = False
-        self.body = None
-
 
     def mouseDown(self, p):
+        if self.app.renderer is not None:
+            # Nothing to hit-test in the view; the body is found in the world,
+            # where the physics runs. Graphics follow once the joint exists.
+            self.mouseDrag = True
+            self.p = p
+            self.app.post(self.drag.grab, self.app.viewToWorld(p))
+            return
         self.target = self.view.itemAt(p)
         if self.target and not self.target == self.groundBody.graphics:
             data = self.target.data(0)
             if data:
-                self.body = data.body
                 self.mouseDrag = True
                 # map point
                 scene_pt = self.app.viewToWorld(p)
-                self.joint = self.world.CreateMouseJoint(
-                    bodyA=self.groundBody.body,
-                    bodyB=self.body,
-                    target=scene_pt,
-                    maxForce=8000,
-                    collideConnected=True)
-                self.body.awake = True
+                # The joint is made wherever the physics runs
+                self.app.post(self.drag.grabBody,
+                              self.app.sim.bodies.index(data), scene_pt)
                 self.p = p
-                self.startPt = self.body.GetLocalPoint(scene_pt)
                 self.createGraphics()
 
     def mouseUp(self, p):
-        if self.joint:
-            self.world.DestroyJoint(self.joint)
-            self.joint = None
+        self.app.post(self.drag.release)
         self.mouseDrag = False
         self.target = None
-        self.destroyGraphics()
+        self.hideGraphics()
 
     def mouseMove(self, p):
-        if self.mouseDrag and self.joint:
-            self.joint.target = self.app.viewToWorld(p)
+        if self.mouseDrag:
+            self.app.post(self.drag.move, self.app.viewToWorld(p))
             self.p = p
-            self.updateGraphics()
+            # With a physics thread, the next snapshot redraws instead
+            if not self.app.worker:
+                self.updateGraphics()
         else:
             self.mouseDown(p)
 
     def createGraphics(self):
-        self.label = Label(self.scene, self.p)
-        self.line = self.scene.addLine(
-            self.p.x(), self.p.y(),
-            self.p.x(), self.p.y(),
-            QPen(Qt.yellow, 3))
+        '''Shows the drag line and force label, reusing the items of the
+        last drag if there was one.'''
+        if self.line is None:
+            self.label = Label(self.scene, self.p)
+            self.line = self.scene.addLine(
+                self.p.x(), self.p.y(),
+                self.p.x(), self.p.y(),
+                QPen(Qt.yellow, 3))
+            return
+        self.label.setText('')
+        self.label.setPos(self.app.viewToScene(self.p))
+        self.label.item.show()
+        self.line.setLine(self.p.x(), self.p.y(), self.p.x(), self.p.y())
+        self.line.show()
 
-    def updateGraphics(self):
-        if not self.joint:
+    def getDisplayState(self):
+        drag = self.drag
+        if not drag.joint:
+            return None
+        force = drag.joint.GetReactionForce(world_fps)
+        worldPt = drag.body.GetWorldPoint(drag.startPt)
+        return ((force.x, force.y), (worldPt.x, worldPt.y))
+
+    def updateGraphics(self, state=None):
+        if not self.mouseDrag:
             return
+        if state is None:
+            state = self.getDisplayState()
+            if state is None:
+                return
+        force, worldPt = state
+        if self.line is None or not self.line.isVisible():
+            self.createGraphics()
         scene_mouse = self.app.viewToScene(self.p)
         if self.label:
             self.label.setPos(scene_mouse)
-            force = self.joint.GetReactionForce(world_fps)
             self.label.setText(
-                '[{0:.2f}N,{1:.2f}N]'.format(force.x, force.y))
+                '[{0:.2f}N,{1:.2f}N]'.format(force[0], force[1]))
         if self.line:
-            worldPt = self.body.GetWorldPoint(self.startPt)
             self.line.setLine(
-                worldPt.x*world_scale,
-                worldPt.y*world_scale,
+                worldPt[0]*world_scale,
+                worldPt[1]*world_scale,
                 scene_mouse.x(), scene_mouse.y()
             )
 
+    def hideGraphics(self):
+        '''Hides the drag items until the next drag.'''
+        if self.line:
+            self.label.item.hide()
+            self.line.hide()
+
     def destroyGraphics(self):
         if self.label:
             self.label.cleanup()
@@ -95,4 +123,5 @@ class MouseDrag(object):
             self.line = None
 
     def cleanup(self):
-        self.mouseUp()
+        self.mouseUp(None)
+        self.destroyGraphics()
@@ -0,0 +1,99 @@
+import json
+import threading
+from collections import deque
+from time import perf_counter
+
+from senesim.config import *
+
+
+class Profiler(object):
+    '''Times the phases of a frame. Time is accumulated per phase as the
+    frame runs (any number of substeps), and at endFrame the frame's totals
+    are added to a rolling window of the last window frames, from which
+    stats gives the mean, 95th percentile and maximum.
+
+    Phases are timed by one thread; endFrame and the readers (stats, export)
+    may be on different threads.'''
+
+    def __init__(self, window=profile_window):
+        self.window = window
+        self.current = {}
+        self.history = {}
+        self.totals = {}
+        self.frames = 0
+        self.lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        current = self.current
+        current[phase] = current.get(phase, 0.0) + seconds
+
+    def time(self, phase, function, *args):
+        '''Calls function(*args), adding the time it takes to phase.'''
+        start = perf_counter()
+        result = function(*args)
+        self.add(phase, perf_counter() - start)
+        return result
+
+    def endFrame(self):
+        current = self.current
+        self.current = {}
+        with self.lock:
+            for phase in current:
+                if phase not in self.history:
+                    self.history[phase] = deque([0.0] * min(self.frames,
+                                                            self.window),
+                                                maxlen=self.window)
+                    self.totals[phase] = 0.0
+            for phase, frames in self.history.items():
+                seconds = current.get(phase, 0.0)
+                frames.append(seconds)
+                self.totals[phase] += seconds
+            self.frames += 1
+
+    def stats(self):
+        '''Returns {phase: (mean, p95, max)} over the window, in seconds per
+        frame, in the order phases were first seen.'''
+        with self.lock:
+            history = {phase: sorted(frames)
+                       for phase, frames in self.history.items()}
+        stats = {}
+        for phase, frames in history.items():
+            if not frames:
+                continue
+            p95 = frames[int(round(0.95 * (len(frames) - 1)))]
+            stats[phase] = (sum(frames) / len(frames), p95, frames[-1])
+        return stats
+
+    def report(self):
+        '''Formats stats as a table, in milliseconds per frame.'''
+        lines = ['{0:<20}{1:>8}{2:>8}{3:>8}'.format(
+            'ms/frame', 'mean', 'p95', 'max')]
+        for phase, values in self.stats().items():
+            lines.append('{0:<20}{1:>8.2f}{2:>8.2f}{3:>8.2f}'.format(
+                phase, *(v * 1000 for v in values)))
+        return '\n'.join(lines)
+
+    def toDict(self):
+        with self.lock:
+            frames = {phase: list(values)
+                      for phase, values in self.history.items()}
+            totals = dict(self.totals)
+            n = self.frames
+        return {
+            'frames': n,
+            'stats_ms': {phase: dict(zip(('mean', 'p95', 'max'),
+                                         (v * 1000 for v in values)))
+                         for phase, values in self.stats().items()},
+            'totals_s': totals,
+            'window_ms': {phase: [v * 1000 for v in values]
+                          for phase, values in frames.items()},
+        }
+
+
+def writeProfile(path, profilers):
+    '''Writes the stats and recent frame times of named profilers (a dict of
+    name to Profiler, None entries are skipped) to a JSON file.'''
+    with open(path, 'w') as f:
+        json.dump({name: profiler.toDict()
+                   for name, profiler in profilers.items()
+                   if profiler is not None}, f, indent=2)
@@ -0,0 +1,139 @@
+import json
+import os
+import struct
+
+from senesim.config import *
+from senesim.scene import Elastic
+
+# File layout: magic, header length (uint32), JSON header, then one
+# fixed-size record per frame - the step number (uint32) followed by one
+# float32 per column. Records are only ever appended.
+magic = b'SENEREC1'
+prefix = struct.Struct('<8sI')
+
+
+def getColumns(sim):
+    '''Names of the recorded columns for a simulation, in record order:
+    x, y and angle of each body, length and tension of each elastic, and
+    target and position of each tendon controller.'''
+    body_names = {body: name for name, body in sim.bodyIds.items()}
+    elastic_names = {e: name for name, e in sim.elastics.items()}
+    columns = []
+    for n, body in enumerate(sim.bodies):
+        name = body_names.get(body, n)
+        columns += ['body.{0}.{1}'.format(name, f)
+                    for f in ('x', 'y', 'angle')]
+    for n, elastic in enumerate(getElastics(sim)):
+        name = elastic_names.get(elastic, n)
+        columns += ['elastic.{0}.{1}'.format(name, f)
+                    for f in ('length', 'tension')]
+    for n, controller in enumerate(sim.controllers):
+        columns += ['controller.{0}.{1}'.format(n, f)
+                    for f in ('target', 'position')]
+    return columns
+
+
+def getElastics(sim):
+    return [c for c in sim.constraints if isinstance(c, Elastic)]
+
+
+class RecordWriter(object):
+    '''A file that records are appended to, each flushed as soon as it is
+    written, so that what has been recorded so far can be read back (by
+    Trajectory or InputLog) while recording goes on.'''
+
+    def __init__(self, path, mode='wb'):
+        self.file = open(path, mode)
+
+    def write(self, data):
+        self.file.write(data)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class TrajectoryRecorder(object):
+    '''Appends one record per frame of a simulation to a binary file.'''
+
+    def __init__(self, sim, path):
+        self.sim = sim
+        self.path = path
+        self.elastics = getElastics(sim)
+        self.columns = getColumns(sim)
+        self.record_struct = struct.Struct('<I{0}f'.format(len(self.columns)))
+        header = json.dumps({
+            'scene': sim.filePath,
+            'delta_t': 1 / world_fps,
+            'columns': self.columns,
+            'controllers': [c.label for c in sim.controllers],
+        }).encode('utf-8')
+        self.file = RecordWriter(path)
+        self.file.write(prefix.pack(magic, len(header)) + header)
+        self.frames = 0
+
+    def record(self):
+        sim = self.sim
+        values = []
+        for body in sim.bodies:
+            b = body.body
+            pos = b.position
+            values += (pos.x, pos.y, b.angle)
+        delta_t = 1 / world_fps
+        for elastic in self.elastics:
+            values += (elastic.getLength(), elastic.getInternalForce(delta_t))
+        for controller in sim.controllers:
+            values += (controller.target, controller.position)
+        self.file.write(self.record_struct.pack(sim.step_n, *values))
+        self.frames += 1
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class Trajectory(object):
+    '''Read-only view of a recording, memory-mapped with numpy. Frames are
+    records with fields 'step' and 'data'; columns can be sliced out by
+    name without reading the rest of the file.'''
+
+    def __init__(self, path):
+        import numpy as np
+        with open(path, 'rb') as f:
+            file_magic, header_length = prefix.unpack(f.read(prefix.size))
+            if file_magic != magic:
+                raise Exception('{0} is not a recording'.format(path))
+            self.header = json.loads(f.read(header_length).decode('utf-8'))
+        self.path = path
+        self.columns = self.header['columns']
+        self.scene = self.header['scene']
+        self.delta_t = self.header['delta_t']
+        self.index = {name: n for n, name in enumerate(self.columns)}
+        self.dtype = np.dtype([('step', '<u4'),
+                               ('data', '<f4', (len(self.columns),))])
+        offset = prefix.size + header_length
+        frames = (os.path.getsize(path) - offset) // self.dtype.itemsize
+        if frames > 0:
+            self.records = np.memmap(path, dtype=self.dtype, mode='r',
+                                     offset=offset, shape=(frames,))
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, frame):
+        return self.records[frame]
+
+    def steps(self):
+        return self.records['step']
+
+    def column(self, name):
+        return self.records['data'][:, self.index[name]]
+
+    def bodyStates(self, frame):
+        '''(x, y, angle) of each body in the given frame, in scene order.'''
+        data = self.records['data'][frame]
+        n = sum(1 for name in self.columns if name.startswith('body.')) // 3
+        return data[:3 * n].reshape(n, 3).tolist()
@@ -0,0 +1,309 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from PyQt5.QtWidgets import *
+from PyQt5.QtCore import *
+from PyQt5.QtGui import *
+
+from senesim.config import *
+from senesim.scene import Elastic, Load
+
+
+def toPolygon(points):
+    '''Returns a QPolygonF of an (n, 2) array of points, copied in one go.'''
+    points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 2)
+    polygon = QPolygonF(len(points))
+    if len(points):
+        buffer = polygon.data()
+        buffer.setsize(points.nbytes)
+        np.frombuffer(buffer, dtype=np.float64)[:] = points.ravel()
+    return polygon
+
+
+class SceneRenderer(QGraphicsItem):
+    '''A single scene item that draws every body, elastic path and force
+    vector of a simulation in one paint call, instead of one scene item per
+    shape (see render_batched). Body outlines and force vectors are kept in
+    flat arrays, updated together with numpy when display states change, and
+    drawn from there; there is no per-item bookkeeping in the scene.
+
+    The renderer has no items to hit-test, so MouseDrag queries Box2D for the
+    body under the mouse instead. Like the scene's item index would, paint
+    skips bodies and elastics outside the exposed area. Without numpy, the
+    window draws with an item per shape instead.'''
+
+    available = np is not None
+
+    def __init__(self):
+        super(SceneRenderer, self).__init__()
+        # For option.exposedRect
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.forcesVisible = True
+        self.bodyPen = QPen()
+        self.elasticPen = QPen(QBrush(Qt.black), 2)
+        self.forcePens = [QPen(Qt.red, 3), QPen(Qt.green, 3),
+                          QPen(Qt.blue, 3)]
+        self.loadPen = QPen(Qt.green, 4)
+        self.labelFont = QFont('Arial', pointSize=8)
+        self.rect = QRectF()
+        self.clear()
+
+    def clear(self):
+        self.bodies = []
+        self.elastics = []
+        self.loads = []
+        # Indexes of the bodies that can move
+        self.moving = []
+        # Display states, in the order of the lists above, as last drawn
+        self.bodyStates = []
+        self.elasticStates = []
+        self.loadStates = []
+        # Per body: brush, label, and its slot in the box outlines, or its
+        # radius (a float) for circles
+        self.brushes = []
+        self.labels = []
+        self.slots = []
+        self.boxes = np.zeros(0, dtype=int)
+        self.boxCorners = np.zeros((0, 4, 2))
+        self.reach = np.zeros(0)
+        # Drawn geometry, in scene units: body centres, the corners of every
+        # box (four points per box), and per elastic its path, dash scaling
+        # and bounds
+        self.centers = np.zeros((0, 2))
+        self.outlines = QPolygonF()
+        self.paths = []
+        # Force vectors, as (n, 2, 2) arrays of line end points
+        self.forceLines = [np.zeros((0, 2, 2))] * 3
+        self.loadLines = np.zeros((0, 2, 2))
+
+    def attach(self, sim):
+        '''Draws the scene of sim from now on, starting from its current
+        state.'''
+        self.clear()
+        self.bodies = list(sim.bodies)
+        self.elastics = [c for c in sim.constraints if isinstance(c, Elastic)]
+        self.loads = [c for c in sim.constraints if isinstance(c, Load)]
+        self.moving = [i for i, body in enumerate(self.bodies)
+                       if not body.static]
+        boxes = []
+        corners = []
+        for i, body in enumerate(self.bodies):
+            kind, width, height = body.shape
+            w = width * world_scale
+            h = height * world_scale
+            if kind == 'circle':
+                self.slots.append(float(w))
+            else:
+                self.slots.append(len(boxes))
+                boxes.append(i)
+                corners.append([(-w, -h), (w, -h), (w, h), (-w, h)])
+            color = body.color
+            self.brushes.append(
+                QBrush(QColor.fromRgbF(color[0], color[1], color[2])))
+            self.labels.append(body.labelText)
+        self.boxes = np.array(boxes, dtype=int)
+        self.boxCorners = np.array(corners, dtype=float).reshape(-1, 4, 2)
+        self.reach = np.array([body.extent for body in self.bodies],
+                              dtype=float) * world_scale
+        self.bodyStates = [body.getDisplayState() for body in self.bodies]
+        self.elasticStates = [elastic.getDisplayState()
+                              for elastic in self.elastics]
+        self.loadStates = [load.getDisplayState() for load in self.loads]
+        for elastic in self.elastics:
+            # Applied forces are only recorded for elastics that are drawn
+            elastic.displayed = True
+        self.updateBodies()
+        self.paths = [self.getPath(state) for state in self.elasticStates]
+        self.updateForces()
+        self.update()
+
+    def setStates(self, states=None):
+        '''Takes the display states to draw: those in states, a snapshot's
+        {object: state}, or else the objects' current ones. As with the
+        per-object items, bodies that moved less than graphics_move_threshold
+        pixels keep their drawn state, elastic paths are only refreshed if a
+        body they run over moved, and nothing is repainted if nothing
+        changed. Elastic forces, which change without anything moving, are
+        refreshed on every call while they are shown.'''
+        bodyStates = self.bodyStates
+        moved = set()
+        for i in self.moving:
+            body = self.bodies[i]
+            if states is None:
+                state = body.getDisplayState()
+            else:
+                state = states.get(body)
+                if state is None:
+                    continue
+            x, y, angle = state
+            drawn = bodyStates[i]
+            distance = (abs(x - drawn[0]) + abs(y - drawn[1]) +
+                        abs(angle - drawn[2]) * body.extent)
+            if distance * world_scale >= graphics_move_threshold:
+                bodyStates[i] = state
+                moved.add(body.body)
+        elasticsChanged = False
+        forcesChanged = False
+        for i, elastic in enumerate(self.elastics):
+            if states is None:
+                state = None
+                restLength = elastic.restLength
+            else:
+                state = states.get(elastic)
+                if state is None:
+                    continue
+                restLength = state[2]
+            if (restLength == self.elasticStates[i][2] and
+                    moved.isdisjoint(elastic.getBodies())):
+                if self.forcesVisible:
+                    applied = (elastic.appliedForces if state is None
+                               else state[3])
+                    self.elasticStates[i] = (self.elasticStates[i][:3] +
+                                             (applied,))
+                    forcesChanged = True
+                continue
+            if state is None:
+                state = elastic.getDisplayState()
+            self.elasticStates[i] = state
+            self.paths[i] = self.getPath(state)
+            elasticsChanged = True
+        loadsChanged = False
+        for i, load in enumerate(self.loads):
+            if states is None:
+                state = load.getDisplayState()
+            else:
+                state = states.get(load)
+            if state is not None and state != self.loadStates[i]:
+                self.loadStates[i] = state
+                loadsChanged = True
+        if moved:
+            self.updateBodies()
+        if elasticsChanged or forcesChanged or loadsChanged:
+            forcesChanged = self.updateForces()
+        if moved or elasticsChanged or forcesChanged or loadsChanged:
+            self.update()
+
+    def updateBodies(self):
+        '''Recomputes body centres and box outlines from their states, and
+        grows the bounding rect to cover them. Elastics and loads are
+        attached to bodies, so a margin for force vectors is enough for
+        those.'''
+        states = np.array(self.bodyStates, dtype=float).reshape(-1, 3)
+        self.centers = states[:, :2] * world_scale
+        angles = states[self.boxes, 2]
+        c = np.cos(angles)[:, None]
+        s = np.sin(angles)[:, None]
+        x = self.boxCorners[:, :, 0]
+        y = self.boxCorners[:, :, 1]
+        corners = np.stack((c * x - s * y, s * x + c * y), axis=2)
+        corners += self.centers[self.boxes][:, None, :]
+        self.outlines = toPolygon(corners)
+        if not len(self.centers):
+            return
+        margin = self.reach.max() + 100
+        low = self.centers.min(axis=0) - margin
+        high = self.centers.max(axis=0) + margin
+        rect = QRectF(QPointF(*low), QPointF(*high))
+        if not self.rect.contains(rect):
+            self.prepareGeometryChange()
+            self.rect = self.rect.united(rect)
+
+    def getPath(self, state):
+        '''Returns the (polyline, dash scaling, bounds) of an elastic state.
+        The path is drawn from anchorB, as the elastic's own item does.'''
+        points, length, restLength, applied = state
+        points = np.array(points, dtype=float)
+        low = points.min(axis=0)
+        high = points.max(axis=0)
+        return (toPolygon(points[::-1]), length / restLength,
+                (low[0], low[1], high[0], high[1]))
+
+    def updateForces(self):
+        '''Recomputes the force vectors of the elastics, as line end points
+        grouped by pen (first anchor, contacts, last anchor), and of the
+        loads. Returns whether any of them changed.'''
+        groups = ([], [], [])
+        for elastic, state in zip(self.elastics, self.elasticStates):
+            applied = state[3]
+            if applied is None:
+                continue
+            points = np.array(applied[0], dtype=float) * world_scale
+            ends = points + np.array(applied[1], dtype=float) / elastic.k
+            lines = np.stack((points, ends), axis=1)
+            groups[0].append(lines[:1])
+            groups[1].append(lines[1:-1])
+            groups[2].append(lines[-1:])
+        forceLines = [np.concatenate(group) if group
+                      else np.zeros((0, 2, 2)) for group in groups]
+        loadLines = np.array(self.loadStates, dtype=float).reshape(-1, 2, 2)
+        changed = not (
+            all(np.array_equal(a, b)
+                for a, b in zip(forceLines, self.forceLines)) and
+            np.array_equal(loadLines, self.loadLines))
+        self.forceLines = forceLines
+        self.loadLines = loadLines
+        return changed
+
+    def boundingRect(self):
+        return self.rect
+
+    def paint(self, painter, option, widget=None):
+        exposed = option.exposedRect
+        left = exposed.left()
+        right = exposed.right()
+        bottom = exposed.top()
+        top = exposed.bottom()
+        # Bodies
+        centers = self.centers
+        reach = self.reach
+        visible = np.flatnonzero(
+            (centers[:, 0] + reach > left) & (centers[:, 0] - reach < right) &
+            (centers[:, 1] + reach > bottom) & (centers[:, 1] - reach < top))
+        painter.setPen(self.bodyPen)
+        brush = None
+        outlines = self.outlines
+        labels = []
+        for i in visible.tolist():
+            if self.brushes[i] is not brush:
+                brush = self.brushes[i]
+                painter.setBrush(brush)
+            slot = self.slots[i]
+            if slot.__class__ is int:
+                painter.drawConvexPolygon(outlines.mid(slot * 4, 4))
+            else:
+                painter.drawEllipse(QPointF(*centers[i]), slot, slot)
+            if self.labels[i]:
+                labels.append(i)
+        # Labels upright, over the bodies
+        if labels:
+            base = painter.transform()
+            painter.setFont(self.labelFont)
+            for i in labels:
+                x, y = centers[i]
+                painter.setTransform(QTransform(1, 0, 0, -1, x, y) * base)
+                painter.drawText(QRectF(-200, -20, 400, 40), Qt.AlignCenter,
+                                 self.labels[i])
+            painter.setTransform(base)
+        # Elastic paths, dashed in proportion to their stretch
+        painter.setBrush(Qt.NoBrush)
+        pen = self.elasticPen
+        for path, scaling, (l, b, r, t) in self.paths:
+            if r < left or l > right or t < bottom or b > top:
+                continue
+            pen.setDashPattern([5 * scaling, 2 * scaling])
+            pen.setColor(QColor(100, 100, 100) if scaling < 1 else Qt.black)
+            painter.setPen(pen)
+            painter.drawPolyline(path)
+        if not self.forcesVisible:
+            return
+        for pen, lines in zip(self.forcePens + [self.loadPen],
+                              self.forceLines + [self.loadLines]):
+            low = lines.min(axis=1)
+            high = lines.max(axis=1)
+            lines = lines[(high[:, 0] > left) & (low[:, 0] < right) &
+                          (high[:, 1] > bottom) & (low[:, 1] < top)]
+            if len(lines):
+                painter.setPen(pen)
+                painter.drawLines(toPolygon(lines))
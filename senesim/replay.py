@@ -0,0 +1,46 @@
+'''Replays recorded inputs headless, at full speed (see senesim.inputs).
+
+    python -m senesim.replay session.seneinp
+    python -m senesim.replay session.seneinp --record session.senerec
+
+Interactive sessions recorded with the window's Record Inputs button become
+batch runs: the replay reports how fast it ran, and --record writes the
+replayed trajectory for comparing against other runs.
+'''
+import argparse
+from time import perf_counter
+
+from senesim.inputs import InputLog, replayInputs
+from senesim.simulation import Simulation
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m senesim.replay',
+        description='Replay recorded inputs headless.')
+    parser.add_argument('inputs', help='Input recording (.seneinp)')
+    parser.add_argument('--scene',
+                        help='Scene file (default: the recorded one)')
+    parser.add_argument('--steps', type=int, default=None,
+                        help='Substeps to run for (default: as recorded)')
+    parser.add_argument('--record',
+                        help='Record the replayed trajectory to this file')
+    args = parser.parse_args(argv)
+
+    log = InputLog(args.inputs)
+    sim = Simulation()
+    sim.load(args.scene or log.scene)
+    if args.record:
+        sim.startRecording(args.record)
+    start = perf_counter()
+    replayInputs(sim, log, args.steps)
+    elapsed = perf_counter() - start
+    sim.stopRecording()
+    print('Replayed {0} inputs over {1} substeps in {2:.2f}s '
+          '({3:.0f} substeps/s, {4:.1f}x real time)'.format(
+              len(log), sim.step_n, elapsed, sim.step_n / elapsed,
+              sim.step_n * log.delta_t / elapsed))
+
+
+if __name__ == '__main__':
+    main()
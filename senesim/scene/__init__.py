@@ -1,4 +1,4 @@
 from .body import Body
-from .elastic import Elastic
-from .label import Label
+from .elastic import Elastic, CubicElastic
 from .load import Load
+from .batch import ElasticBatch
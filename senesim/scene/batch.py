@@ -0,0 +1,164 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from Box2D import *
+
+from senesim.config import *
+from senesim.scene.elastic import Elastic
+
+
+class ElasticBatch(object):
+    '''Computes and applies the forces of many elastics at once. The anchors
+    and contacts of every elastic are kept in flat arrays, so that world
+    points, tensions and contact forces for the whole scene come from one
+    vectorized pass per substep. Forces are summed per body and applied as a
+    single force and torque.
+
+    The Elastic objects remain the owners of k, damping, restLength and
+    last_extension, so controllers and sliders work on them as usual. The
+    batch must be rebuilt if contacts are added to an elastic.'''
+
+    available = np is not None
+
+    def __init__(self, elastics):
+        self.elastics = list(elastics)
+        bodies = []
+        body_index = {}
+        point_body = []
+        point_local = []
+        point_elastic = []
+        counts = []
+        for n, elastic in enumerate(self.elastics):
+            path = [(elastic.bodyA, elastic.localAnchorA)]
+            path += [(c['body'], c['point']) for c in elastic.contacts]
+            path.append((elastic.bodyB, elastic.localAnchorB))
+            for body, local in path:
+                if body not in body_index:
+                    body_index[body] = len(bodies)
+                    bodies.append(body)
+                point_body.append(body_index[body])
+                point_local.append((local.x, local.y))
+                point_elastic.append(n)
+            counts.append(len(path))
+        self.bodies = bodies
+        self.pointBody = np.array(point_body, dtype=np.intp)
+        self.pointLocal = np.array(point_local, dtype=float).reshape(-1, 2)
+        self.pointElastic = np.array(point_elastic, dtype=np.intp)
+        counts = np.array(counts, dtype=np.intp)
+        # Index of each elastic's first and last point
+        self.first = np.cumsum(counts) - counts
+        self.last = self.first + counts - 1
+        # Contact (interior) points, and the segments leaving each point
+        interior = np.ones(len(point_body), dtype=bool)
+        interior[self.first] = False
+        interior[self.last] = False
+        self.contacts = np.flatnonzero(interior)
+        self.segments = np.setdiff1d(np.arange(len(point_body)), self.last)
+        # Elastics whose law differs from the linear one are evaluated
+        # individually through getTension
+        self.custom = [n for n, elastic in enumerate(self.elastics)
+                       if type(elastic).getTension is not Elastic.getTension]
+        self.points = None
+        self.lengths = None
+        self.forces = None
+
+    def updateGeometry(self):
+        '''Recomputes the world points and lengths of every elastic, and hands
+        the lengths on to the elastics' caches. Call after every world step,
+        or whenever bodies have been moved.'''
+        transforms = np.array(
+            [(body.position.x, body.position.y, body.angle)
+             for body in self.bodies], dtype=float).reshape(-1, 3)
+        pos = transforms[self.pointBody, :2]
+        angle = transforms[self.pointBody, 2]
+        c = np.cos(angle)
+        s = np.sin(angle)
+        lx = self.pointLocal[:, 0]
+        ly = self.pointLocal[:, 1]
+        points = np.empty_like(pos)
+        points[:, 0] = pos[:, 0] + c * lx - s * ly
+        points[:, 1] = pos[:, 1] + s * lx + c * ly
+        self.points = points
+        # Segment vectors, from each non-final point to the next
+        seg = points[self.segments + 1] - points[self.segments]
+        seg_length = np.hypot(seg[:, 0], seg[:, 1])
+        self.segmentVectors = seg
+        self.segmentLengths = seg_length
+        # Each elastic with m points owns m - 1 consecutive segments
+        seg_first = self.first - np.arange(len(self.elastics))
+        self.lengths = np.add.reduceat(seg_length, seg_first) * world_scale
+        for elastic, length in zip(self.elastics, self.lengths.tolist()):
+            elastic.cacheLength(length)
+
+    def getTensions(self, extensions, delta_t):
+        params = [(e.k, e.damping, e.last_extension) for e in self.elastics]
+        k, damping, last = np.array(params, dtype=float).reshape(-1, 3).T
+        rate = (extensions - last) / delta_t
+        tensions = np.where(extensions > 0,
+                            damping * rate + k * extensions, 0.0)
+        for n in self.custom:
+            tensions[n] = self.elastics[n].getTension(extensions[n], delta_t)
+        return tensions
+
+    def updateForces(self, delta_t):
+        if self.points is None:
+            self.updateGeometry()
+        points = self.points
+        rest = np.array([e.restLength for e in self.elastics], dtype=float)
+        extensions = self.lengths - rest
+        tensions = self.getTensions(extensions, delta_t)
+
+        # Unit vectors along each segment; degenerate segments have no
+        # direction (as b2Vec2.Normalize leaves them at zero)
+        seg_length = self.segmentLengths[:, None]
+        units = np.divide(self.segmentVectors, seg_length,
+                          out=np.zeros_like(self.segmentVectors),
+                          where=seg_length > b2_epsilon)
+        # Per point directions towards the next and previous points
+        n_points = len(points)
+        to_next = np.zeros((n_points, 2))
+        to_next[self.segments] = units
+        to_prev = np.zeros((n_points, 2))
+        to_prev[self.segments + 1] = -units
+
+        f = tensions[self.pointElastic][:, None]
+        forces = np.zeros((n_points, 2))
+        # Anchors pull towards their neighbouring point on the path
+        forces[self.first] = to_next[self.first] * f[self.first]
+        forces[self.last] = to_prev[self.last] * f[self.last]
+        # Contacts are pushed along the bisector of the two segments
+        ca = to_prev[self.contacts]
+        bisector = (ca + to_next[self.contacts]) / 2
+        b_length = np.hypot(bisector[:, 0], bisector[:, 1])[:, None]
+        bisector = np.divide(bisector, b_length, out=np.zeros_like(bisector),
+                             where=b_length > b2_epsilon)
+        along = np.sum(bisector * ca, axis=1)[:, None]
+        forces[self.contacts] = bisector * along * f[self.contacts]
+        self.forces = forces
+
+        self.applyForces(points, forces)
+        for n, extension in enumerate(extensions.tolist()):
+            elastic = self.elastics[n]
+            elastic.last_extension = extension
+            if elastic.displayed:
+                span = slice(self.first[n], self.last[n] + 1)
+                elastic.appliedForces = (points[span], forces[span])
+
+    def applyForces(self, points, forces):
+        '''Sums the point forces per body, and applies each sum as one force
+        at the body's centre of mass plus a torque.'''
+        n = len(self.bodies)
+        centers = np.array([tuple(body.worldCenter) for body in self.bodies],
+                           dtype=float).reshape(-1, 2)
+        r = points - centers[self.pointBody]
+        torques = r[:, 0] * forces[:, 1] - r[:, 1] * forces[:, 0]
+        total_force = np.zeros((n, 2))
+        np.add.at(total_force, self.pointBody, forces)
+        total_torque = np.bincount(self.pointBody, weights=torques,
+                                   minlength=n)
+        for body, force, torque in zip(self.bodies, total_force.tolist(),
+                                       total_torque.tolist()):
+            body.ApplyForceToCenter(force, True)
+            body.ApplyTorque(torque, True)
@@ -1,21 +1,23 @@
 import math
 
-from PyQt5.QtWidgets import *
-from PyQt5.QtCore import *
-from PyQt5.QtGui import *
-
 from Box2D import *
 
-from senesim import *
 from senesim.config import *
+from senesim.scene import qt
 
 
 
 class Body(object):
 
-    def __init__(self, world, scene):
+    def __init__(self, world, scene=None):
         self.world = world
         self.scene = scene
+        self.graphics = None
+        self.label = None
+        # State the items were last moved to, and whether that was in the
+        # latest graphics update (see updateGraphics)
+        self.drawnState = None
+        self.moved = False
         self._initialized = False
 
     def initBox(self, pos, width, height,
@@ -27,23 +29,12 @@ class Body(object):
             raise Exception("Body already initialized")
 
         pos = b2Vec2(pos)
-        self.graphics = self.scene.addRect(
-            (-width) * world_scale,
-            (-height) * world_scale,
-            width * world_scale * 2,
-            height * world_scale * 2,
-            brush=QBrush(QColor.fromRgbF(color[0], color[1], color[2])))
-        self.graphics.setData(0, self)
+        self.shape = ('box', width, height)
+        self.extent = math.hypot(width, height)
+        self.color = color
+        self.labelText = label
         self.static = static
 
-        if label:
-            self.label = self.scene.addText(
-                label, QFont('Arial', pointSize=8))
-            self.label.setPos(pos.x * world_scale, pos.y * world_scale)
-            self.label.setTransform(QTransform.fromScale(1, -1), True)
-        else:
-            self.label = None
-
         if static:
             self.body = self.world.CreateStaticBody(
                 position=pos,
@@ -60,6 +51,9 @@ class Body(object):
                 density=density,
                 friction=friction,
                 restitution=restitution)
+        self._initialized = True
+        if self.scene is not None:
+            self.initGraphics(self.scene)
 
     def initCircle(self, pos, radius,
                    static=False, color=default_color,
@@ -69,23 +63,13 @@ class Body(object):
         if self._initialized:
             raise Exception("Body already initilized")
 
-        self.graphics = self.scene.addEllipse(
-            (-radius) * world_scale,
-            (-radius) * world_scale,
-            radius * world_scale * 2,
-            radius * world_scale * 2,
-            brush=QBrush(QColor.fromRgbF(color[0], color[1], color[2])))
-        self.graphics.setData(0, self)
+        pos = b2Vec2(pos)
+        self.shape = ('circle', radius, radius)
+        self.extent = radius
+        self.color = color
+        self.labelText = label
         self.static = static
 
-        if label:
-            self.label = self.scene.addText(
-                label, QFont('Arial', pointSize=8))
-            self.label.setPos(pos.x * world_scale, pos.y * world_scale)
-            self.label.setTransform(QTransform.fromScale(1, -1), True)
-        else:
-            self.label = None
-
         if static:
             self.body = self.world.CreateStaticBody(
                 position=pos,
@@ -102,18 +86,102 @@ class Body(object):
                 density=density,
                 friction=friction,
                 restitution=restitution)
+        self._initialized = True
+        if self.scene is not None:
+            self.initGraphics(self.scene)
+
+    def initGraphics(self, scene):
+        '''Creates the scene items for this body. Bodies simulated headless
+        never call this, and have no graphics.'''
+        self.scene = scene
+        kind, width, height = self.shape
+        color = self.color
+        brush = qt.QBrush(qt.QColor.fromRgbF(color[0], color[1], color[2]))
+        if kind == 'box':
+            self.graphics = self.scene.addRect(
+                (-width) * world_scale,
+                (-height) * world_scale,
+                width * world_scale * 2,
+                height * world_scale * 2,
+                brush=brush)
+        else:
+            self.graphics = self.scene.addEllipse(
+                (-width) * world_scale,
+                (-height) * world_scale,
+                width * world_scale * 2,
+                height * world_scale * 2,
+                brush=brush)
+        self.graphics.setData(0, self)
 
-    def updateGraphics(self):
+        if self.labelText:
+            self.label = self.scene.addText(
+                self.labelText, qt.QFont('Arial', pointSize=8))
+            self.label.setTransform(qt.QTransform.fromScale(1, -1), True)
+        else:
+            self.label = None
+        self.drawnState = None
+        self.updateGraphics()
+        self.moved = False
+
+    def takeGraphics(self):
+        '''Detaches this body's scene items, leaving them in the scene, and
+        returns them for adoptGraphics (or None, if it has none).'''
+        if self.graphics is None:
+            return None
+        items = [self.graphics] + ([self.label] if self.label else [])
+        self.graphics = None
+        self.label = None
+        return items
+
+    def adoptGraphics(self, scene, items):
+        '''Takes over the scene items of a body built from the same scene
+        entry, instead of creating new ones.'''
+        self.scene = scene
+        self.graphics = items[0]
+        self.label = items[1] if len(items) > 1 else None
+        self.graphics.setData(0, self)
+        self.drawnState = None
+        self.updateGraphics()
+        self.moved = False
+
+    def getDisplayState(self):
         pos = self.body.position
+        return (pos.x, pos.y, self.body.angle)
+
+    def updateGraphics(self, state=None):
+        '''Moves the scene items to the body's current transform, or to the
+        one recorded in state (from getDisplayState). Movements of less than
+        graphics_move_threshold pixels since the items were last moved are
+        skipped; self.moved tells whether the items moved.'''
+        self.moved = False
+        if self.graphics is None:
+            return
+        if state is None:
+            state = self.getDisplayState()
+        x, y, angle = state
+        drawn = self.drawnState
+        if drawn is not None:
+            distance = (abs(x - drawn[0]) + abs(y - drawn[1]) +
+                        abs(angle - drawn[2]) * self.extent)
+            if distance * world_scale < graphics_move_threshold:
+                return
+        self.drawnState = state
+        self.moved = True
         if self.label:
             rect = self.label.boundingRect()
-            self.label.setPos(pos.x * world_scale - rect.width() / 2,
-                              pos.y * world_scale + rect.height() / 2)
-        self.graphics.setRotation(math.degrees(self.body.angle))
-        self.graphics.setPos(QPoint(pos.x * world_scale, pos.y * world_scale))
+            self.label.setPos(x * world_scale - rect.width() / 2,
+                              y * world_scale + rect.height() / 2)
+        self.graphics.setRotation(math.degrees(angle))
+        self.graphics.setPos(x * world_scale, y * world_scale)
 
-    def cleanup(self):
+    def cleanupGraphics(self):
         if self.label:
             self.scene.removeItem(self.label)
-        self.scene.removeItem(self.graphics)
+            self.label = None
+        if self.graphics:
+            self.scene.removeItem(self.graphics)
+            self.graphics = None
+
+    def cleanup(self):
+        self.cleanupGraphics()
         self.world.DestroyBody(self.body)
@@ -1,20 +1,26 @@
-from PyQt5.QtWidgets import *
-from PyQt5.QtCore import *
-from PyQt5.QtGui import *
+import math
 
 from Box2D import *
 
-from senesim import *
 from senesim.config import *
-
-elastic_pen = QPen(QBrush(Qt.black), 2)
+from senesim.scene import qt
 
 class Elastic(object):
 
-    def __init__(self, world, scene):
+    def __init__(self, world, scene=None):
         self.world = world
         self.scene = scene
+        self.graphics = None
+        # Whether anything draws this elastic: its own items, or a renderer
+        self.displayed = False
+        self.forcesVisible = True
+        # (points, forces) applied at the last substep, for display
+        self.appliedForces = None
         self.contacts = []
+        self._path = None
+        self._length = None
+        # Rest length the path was last drawn with, None to force a redraw
+        self.drawnRestLength = None
 
     def initElastic(self,
                     bodyA,
@@ -30,11 +36,9 @@ class Elastic(object):
         self.localAnchorB = bodyB.GetLocalPoint(anchorB)
         self.k = elastic_k
         self.damping = damping
-        self.graphics_pen = QPen(elastic_pen)
-        self.graphics = self.scene.addPath(QPainterPath(), pen=self.graphics_pen)
-        self.forceLineA = self.scene.addLine(0,0,0,0, QPen(Qt.red, 3))
-        self.forceLineB = self.scene.addLine(0,0,0,0, QPen(Qt.blue, 3))
         self.contactForceLines = []
+        self._path = None
+        self._length = None
         if restLength:
             self.restLength = restLength
             self.calculatedRestLength = False
@@ -42,6 +46,49 @@ class Elastic(object):
             self.restLength = self.getLength()
             self.calculatedRestLength = True
         self.last_extension = 0
+        if self.scene is not None:
+            self.initGraphics(self.scene)
+
+    def initGraphics(self, scene):
+        '''Creates the scene items for the elastic path and its force
+        display. Headless elastics never call this.'''
+        self.scene = scene
+        self.graphics_pen = qt.QPen(qt.QBrush(qt.Qt.black), 2)
+        self.graphics = self.scene.addPath(qt.QPainterPath(),
+                                           pen=self.graphics_pen)
+        self.forceLineA = self.scene.addLine(0,0,0,0, qt.QPen(qt.Qt.red, 3))
+        self.forceLineB = self.scene.addLine(0,0,0,0, qt.QPen(qt.Qt.blue, 3))
+        self.contactForceLines = [
+            self.scene.addLine(0,0,0,0, qt.QPen(qt.Qt.green, 3))
+            for contact in self.contacts]
+        self.drawnRestLength = None
+        self.displayed = True
+        self.updateGraphics()
+
+    def takeGraphics(self):
+        '''Detaches this elastic's scene items, leaving them in the scene,
+        and returns them for adoptGraphics (or None, if it has none).'''
+        if self.graphics is None:
+            return None
+        items = ([self.graphics, self.forceLineA, self.forceLineB] +
+                 self.contactForceLines)
+        self.graphics = None
+        self.contactForceLines = []
+        return items
+
+    def adoptGraphics(self, scene, items):
+        '''Takes over the scene items of an elastic built from the same scene
+        entry, instead of creating new ones.'''
+        self.scene = scene
+        self.graphics_pen = qt.QPen(qt.QBrush(qt.Qt.black), 2)
+        self.graphics, self.forceLineA, self.forceLineB = items[:3]
+        self.contactForceLines = list(items[3:])
+        self.drawnRestLength = None
+        self.displayed = True
+        self.updateGraphics()
+
+    def setK(self, k):
+        self.k = k
 
     def setRestLength(self, length):
         self.restLength = length
@@ -58,20 +105,23 @@ class Elastic(object):
             'body': body,
             'point': pointLocal
         })
-        self.contactForceLines.append(self.scene.addLine(0,0,0,0, QPen(Qt.green, 3)))
+        self.invalidateGeometry()
+        self.drawnRestLength = None
+        if self.graphics is not None:
+            self.contactForceLines.append(
+                self.scene.addLine(0,0,0,0, qt.QPen(qt.Qt.green, 3)))
         if self.calculatedRestLength:
             self.restLength = self.getLength()
 
     def getExtension(self):
         return self.getLength() - self.restLength
 
-    def getInternalForce(self, delta_t):
+    def getTension(self, extension, delta_t):
+        '''The elasticity law: tension at the given extension, including
+        damping relative to the extension at the last step.'''
         # Forces model simple elastic stress, and is dependent on strain
-        extension = self.getExtension()
         extension_rate = (extension - self.last_extension) / delta_t
         if extension > 0:
-            # Cubic elasticity is interesting
-            # elastic_force = self.k * 0.001 * extension * extension * extension
             elastic_force = self.k * extension
             damping = self.damping * extension_rate
         else:
@@ -80,37 +130,62 @@ class Elastic(object):
 
         return damping + elastic_force
 
+    def getExtensionForTension(self, tension, delta_t):
+        '''Exact inverse of getTension. Returns the extension at which the
+        elastic carries the given tension, or None if the law has no closed
+        form inverse (callers then fall back to a root-finder).'''
+        # k * e + damping * (e - last_e) / dt = tension, for e > 0. Below
+        # that the tension jumps from zero, so the crossing is at e = 0.
+        stiffness = self.k + self.damping / delta_t
+        if stiffness <= 0:
+            return None
+        extension = ((tension + self.damping * self.last_extension / delta_t) /
+                     stiffness)
+        return max(extension, 0)
+
+    def getStaticTension(self, extension):
+        '''The tension held at rest at the given extension: the elasticity
+        law without damping.'''
+        if extension > 0:
+            return self.k * extension
+        return 0
+
+    def getInternalForce(self, delta_t):
+        return self.getTension(self.getExtension(), delta_t)
+
     def updateForces(self, delta_t):
-        a = self.bodyA.GetWorldPoint(self.localAnchorA)
-        b = self.bodyB.GetWorldPoint(self.localAnchorB)
         f = self.getInternalForce(delta_t)
-        if len(self.contacts) > 0:
-            contact = self.contacts[0]
-            c0 = contact['body'].GetWorldPoint(contact['point'])
-            contact = self.contacts[-1]
-            ci = contact['body'].GetWorldPoint(contact['point'])
-        else:
-            c0 = b
-            ci = a
+        points, forces = self.getForces(f)
+        self.bodyA.ApplyForce(force=forces[0], point=points[0], wake=True)
+        self.bodyB.ApplyForce(force=forces[-1], point=points[-1], wake=True)
+        for contact, point, force in zip(self.contacts, points[1:-1],
+                                         forces[1:-1]):
+            contact['body'].ApplyForce(force=force, point=point, wake=True)
+        # Recorded for display, which happens once per frame
+        self.appliedForces = (points, forces)
+        self.last_extension = self.getExtension()
+
+    def getForces(self, f):
+        '''Returns the world points of the path and the forces a tension f
+        applies at each of them, in the order of getBodies.'''
+        points = self.getWorldPoints()
+        a = points[0]
+        b = points[-1]
+        # First and last contacts (or the opposite anchors, with no contacts)
+        c0 = points[1]
+        ci = points[-2]
         dir_a = c0 - a
         dir_a.Normalize()
         force_a = dir_a * f
         dir_b = ci - b
         dir_b.Normalize()
         force_b = dir_b * f
-        # Apply Forces
-        self.bodyA.ApplyForce(force=force_a, point=a, wake=True)
-        self.bodyB.ApplyForce(force=force_b, point=b, wake=True)
         # Contact forces
-        last_p = a
-        cl_itr = iter(self.contactForceLines)
+        forces = [force_a]
         for i, contact in enumerate(self.contacts):
-            c_p = contact['body'].GetWorldPoint(contact['point'])
-            if i == len(self.contacts) - 1:
-                next_p = b
-            else:
-                contact_next = self.contacts[i+1]
-                next_p = contact_next['body'].GetWorldPoint(contact_next['point'])
+            last_p = points[i]
+            c_p = points[i+1]
+            next_p = points[i+2]
             # Decompose directions between contact point, and the previous and
             # next points in the chain.
             dir_ca = last_p - c_p
@@ -121,25 +196,19 @@ class Elastic(object):
             dir_c.Normalize()
             force_ca = f*dir_ca
             force_c = dir_c * b2Dot(dir_c, force_ca)
-            contact['body'].ApplyForce(force=force_c, point = c_p, wake=True)
-            # Display
-            force_line = next(cl_itr)
-            force_line.setLine(
-                c_p.x * world_scale, c_p.y * world_scale,
-                c_p.x * world_scale + force_c.x/self.k,
-                c_p.y * world_scale + force_c.y/self.k)
-            last_p = c_p
-
-        # Display
-        self.forceLineA.setLine(
-            a.x * world_scale, a.y * world_scale,
-            a.x * world_scale + force_a.x/self.k,
-            a.y * world_scale + force_a.y/self.k)
-        self.forceLineB.setLine(
-            b.x * world_scale, b.y * world_scale,
-            b.x * world_scale + force_b.x/self.k,
-            b.y * world_scale + force_b.y/self.k)
-        self.last_extension = self.getExtension()
+            forces.append(force_c)
+        forces.append(force_b)
+        return points, forces
+
+    def updateForceLines(self, points, forces):
+        '''Draws the forces applied at each point of the path (anchorA, each
+        contact, then anchorB), given in world coordinates.'''
+        lines = [self.forceLineA] + self.contactForceLines + [self.forceLineB]
+        for line, p, force in zip(lines, points, forces):
+            line.setLine(
+                p[0] * world_scale, p[1] * world_scale,
+                p[0] * world_scale + force[0]/self.k,
+                p[1] * world_scale + force[1]/self.k)
 
     def getStartPoint(self):
         return self.bodyA.GetWorldPoint(self.localAnchorA) * world_scale
@@ -147,59 +216,170 @@ class Elastic(object):
     def getEndPoint(self):
         return self.bodyB.GetWorldPoint(self.localAnchorB) * world_scale
 
+    def invalidateGeometry(self):
+        '''Drops the cached path geometry. This must be called whenever the
+        bodies the elastic is attached to or routed over have moved, i.e.
+        after every world step.'''
+        self._path = None
+        self._length = None
+
+    def cacheLength(self, length):
+        '''Invalidates the cached geometry, but records the path length
+        (in scene units) as computed elsewhere, e.g. by an ElasticBatch.'''
+        self._path = None
+        self._length = length
+
+    def _getPath(self):
+        '''Returns the cached (world points, scaled points, segment lengths,
+        total length) of the routed path, rebuilding it if it is stale.'''
+        if self._path is None:
+            world_points = [self.bodyA.GetWorldPoint(self.localAnchorA)]
+            for contact in self.contacts:
+                world_points.append(
+                    contact['body'].GetWorldPoint(contact['point']))
+            world_points.append(self.bodyB.GetWorldPoint(self.localAnchorB))
+            points = [p * world_scale for p in world_points]
+            lengths = [math.hypot(p1.x - p0.x, p1.y - p0.y)
+                       for p0, p1 in zip(points[:-1], points[1:])]
+            self._path = (world_points, points, lengths, sum(lengths))
+        return self._path
+
+    def getWorldPoints(self):
+        '''Returns the routed path of the elastic, from anchorA through each
+        contact to anchorB, as a list of world points.'''
+        return self._getPath()[0]
+
+    def getPathPoints(self):
+        '''As getWorldPoints, but scaled to scene coordinates.'''
+        return self._getPath()[1]
+
+    def getSegmentLengths(self):
+        return self._getPath()[2]
+
     def getLineDefs(self):
         '''Returns a list of QLineF segments which describe the elastic element
         (its shape) in physical space.'''
-        # Build line segments
-        p_start = self.getStartPoint()
-        p_end = self.getEndPoint()
-        segments = []
-        last_p = p_start
-        for contact in self.contacts:
-            c = contact['body'].GetWorldPoint(contact['point']) * world_scale
-            segments.append(QLineF(last_p.x, last_p.y, c.x, c.y))
-            last_p = c
-        segments.append(QLineF(last_p.x, last_p.y, p_end.x, p_end.y))
-        return segments
-
-    def updateGraphics(self):
-        segments = self.getLineDefs()
-        new_path = QPainterPath()
-        new_path.moveTo(segments[-1].p2())
-        for line in reversed(segments):
-            new_path.lineTo(line.p1())
+        points = self.getPathPoints()
+        return [qt.QLineF(p0.x, p0.y, p1.x, p1.y)
+                for p0, p1 in zip(points[:-1], points[1:])]
+
+    def getDisplayState(self):
+        '''Copies everything updateGraphics needs, so the elastic can be
+        drawn from a snapshot taken on another thread.'''
+        points = [(p.x, p.y) for p in self.getPathPoints()]
+        applied = None
+        if self.appliedForces is not None:
+            applied = tuple([tuple(v) for v in vectors]
+                            for vectors in self.appliedForces)
+        return (points, self.getLength(), self.restLength, applied)
+
+    def getBodies(self):
+        '''The Box2D bodies the path runs over, from bodyA to bodyB.'''
+        return ([self.bodyA] + [contact['body'] for contact in self.contacts] +
+                [self.bodyB])
+
+    def updateGraphics(self, state=None):
+        '''Redraws the force lines, while they are shown, and the path, if
+        any of the bodies it runs over moved in this graphics update (bodies
+        are updated first) or the rest length changed. Tension can change
+        without anything moving (with damping, or a new load), so the force
+        lines are not skipped with the path.'''
+        if self.graphics is None:
+            return
+        if state is None:
+            restLength = self.restLength
+            applied = self.appliedForces
+        else:
+            restLength, applied = state[2], state[3]
+        # Unchanged lines are left alone by QGraphicsLineItem.setLine
+        if self.forcesVisible and applied is not None:
+            self.updateForceLines(*applied)
+        if (restLength == self.drawnRestLength and
+                not any(body.userData.moved for body in self.getBodies())):
+            return
+        self.drawnRestLength = restLength
+        if state is None:
+            points = self.getPathPoints()
+            length = self.getLength()
+        else:
+            points, length = state[:2]
+        new_path = qt.QPainterPath()
+        new_path.moveTo(points[-1][0], points[-1][1])
+        for p in reversed(points[:-1]):
+            new_path.lineTo(p[0], p[1])
         self.graphics.setPath(new_path)
         # Scale and move the pen's dash rendering
-        scaling = self.getLength()/self.restLength
+        scaling = length/restLength
         self.graphics_pen.setDashPattern([5 * scaling, 2 * scaling])
         if scaling < 1:
-            self.graphics_pen.setColor(QColor(100,100,100))
+            self.graphics_pen.setColor(qt.QColor(100,100,100))
         else:
-            self.graphics_pen.setColor(Qt.black)
+            self.graphics_pen.setColor(qt.Qt.black)
         self.graphics.setPen(self.graphics_pen)
 
-
     def getLength(self):
-        length = 0
-        for line in self.getLineDefs():
-            length += line.length()
-        return length
+        if self._length is None:
+            self._length = self._getPath()[3]
+        return self._length
 
-    def cleanup(self):
+    def cleanupGraphics(self):
+        if self.graphics is None:
+            return
         self.scene.removeItem(self.graphics)
         self.scene.removeItem(self.forceLineA)
         self.scene.removeItem(self.forceLineB)
+        for line in self.contactForceLines:
+            self.scene.removeItem(line)
+        self.contactForceLines = []
+        self.graphics = None
+        self.displayed = False
+
+    def cleanup(self):
+        self.cleanupGraphics()
         del self.bodyA
         del self.bodyB
 
     def hideForces(self):
+        self.forcesVisible = False
+        if self.graphics is None:
+            return
         self.forceLineA.hide()
         self.forceLineB.hide()
         for line in self.contactForceLines:
             line.hide()
 
     def showForces(self):
+        self.forcesVisible = True
+        if self.graphics is None:
+            return
+        if self.appliedForces is not None:
+            self.updateForceLines(*self.appliedForces)
         self.forceLineA.show()
         self.forceLineB.show()
         for line in self.contactForceLines:
             line.show()
+
+
+class CubicElastic(Elastic):
+    '''Elastic with a cubic stress-strain response. The tension has no
+    simple inverse, so motors driving it solve for their position
+    numerically.'''
+
+    def getTension(self, extension, delta_t):
+        extension_rate = (extension - self.last_extension) / delta_t
+        if extension > 0:
+            elastic_force = self.k * 0.001 * extension * extension * extension
+            damping = self.damping * extension_rate
+        else:
+            elastic_force = 0
+            damping = 0
+
+        return damping + elastic_force
+
+    def getStaticTension(self, extension):
+        if extension > 0:
+            return self.k * 0.001 * extension * extension * extension
+        return 0
+
+    def getExtensionForTension(self, tension, delta_t):
+        return None
@@ -4,7 +4,6 @@ from PyQt5.QtGui import *
 
 from Box2D import *
 
-from senesim import *
 from senesim.config import *
 
 
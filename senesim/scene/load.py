@@ -1,48 +1,88 @@
-from PyQt5.QtWidgets import *
-from PyQt5.QtCore import *
-from PyQt5.QtGui import *
-
 from Box2D import *
 
-from senesim import *
 from senesim.config import *
+from senesim.scene import qt
 
 
 class Load(object):
-    def __init__(self, world, scene, body, anchor, max=800):
+    def __init__(self, world, body, anchor, max=800, label='Unnamed Load',
+                 scene=None):
         self.world = world
-        self.scene = scene
         self.body = body
         self.anchor = body.GetLocalPoint(anchor)
         self.force = b2Vec2(0, 0)
+        self.label = label
+        self.max = max
+        self.scene = None
+        self.line = None
+        self.drawnState = None
+        if scene is not None:
+            self.initGraphics(scene)
+
+    def initGraphics(self, scene):
+        self.scene = scene
         self.line = self.scene.addLine(
             self.getLineDef(),
-            QPen(Qt.green, 4))
-        self.max = 800
+            qt.QPen(qt.Qt.green, 4))
+
+    def takeGraphics(self):
+        '''Detaches the force line, leaving it in the scene, and returns it
+        for adoptGraphics (or None, if it has none).'''
+        if self.line is None:
+            return None
+        items = [self.line]
+        self.line = None
+        return items
+
+    def adoptGraphics(self, scene, items):
+        self.scene = scene
+        self.line = items[0]
+        self.updateGraphics()
 
     def setForce(self, force):
         self.force = b2Vec2(force)
 
-    def getLineDef(self):
+    def setForceMagnitude(self, magnitude):
+        '''Sets a downward force, as the load slider does.'''
+        self.setForce([0, -magnitude])
+
+    def getDisplayState(self):
         a = self.body.GetWorldPoint(self.anchor)
         b = (a + self.force/100) * world_scale
         a = a * world_scale
-        return QLineF(a.x, a.y, b.x, b.y)
+        return (a.x, a.y, b.x, b.y)
 
-    def updateGraphics(self):
-        self.line.setLine(self.getLineDef())
+    def getLineDef(self):
+        return qt.QLineF(*self.getDisplayState())
+
+    def updateGraphics(self, state=None):
+        if self.line is None:
+            return
+        if state is None:
+            state = self.getDisplayState()
+        if state != self.drawnState:
+            self.drawnState = state
+            self.line.setLine(*state)
 
     def updateForces(self, delta_t):
         a = self.body.GetWorldPoint(self.anchor)
         self.body.ApplyForce(self.force, a, True)
 
-    def cleanup(self):
+    def invalidateGeometry(self):
+        pass
+
+    def cleanupGraphics(self):
         if self.line:
             self.scene.removeItem(self.line)
             self.line = None
 
+    def cleanup(self):
+        self.cleanupGraphics()
+
     def hideForces(self):
-        self.line.hide()
+        if self.line:
+            self.line.hide()
 
     def showForces(self):
-        self.line.show()
+        if self.line:
+            self.line.show()
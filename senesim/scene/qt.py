@@ -0,0 +1,16 @@
+'''The Qt classes scene objects draw themselves with, as qt.QPen, qt.Qt and
+so on. Scenes are also simulated headless, without Qt, so PyQt5 is only
+imported when one of these is first used, once something is drawn.'''
+import importlib
+
+qt_modules = ('PyQt5.QtCore', 'PyQt5.QtGui')
+
+
+def __getattr__(name):
+    for module in qt_modules:
+        value = getattr(importlib.import_module(module), name, None)
+        if value is not None:
+            globals()[name] = value
+            return value
+    raise AttributeError(
+        "module 'senesim.scene.qt' has no attribute '{0}'".format(name))
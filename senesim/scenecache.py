@@ -0,0 +1,253 @@
+import hashlib
+import json
+import logging
+import os
+from collections import namedtuple
+
+import yaml
+
+from senesim.config import *
+
+logger = logging.getLogger(__name__)
+
+# libyaml's loader is much faster, where it is available
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Bump whenever the compiled form changes, to invalidate old cache files
+cache_version = b'senesim-scene-2'
+
+# Compiled scene entries. Defaults are filled in, lists become tuples, and
+# references to other entries are indexes into their lists. Angles are still
+# in fractions of pi, as in the scene file.
+BodyDef = namedtuple('BodyDef', [
+    'id', 'type', 'pos', 'width', 'height', 'density', 'friction',
+    'restitution', 'static', 'color', 'label', 'mass', 'inertia', 'cog'])
+JointDef = namedtuple('JointDef', [
+    'id', 'type', 'bodyA', 'bodyB', 'anchor', 'enableLimit', 'lowerAngle',
+    'upperAngle', 'collideConnected', 'maxMotorTorque', 'motorSpeed',
+    'enableMotor', 'referenceAngle'])
+ElasticDef = namedtuple('ElasticDef', [
+    'id', 'model', 'bodyA', 'bodyB', 'anchorA', 'anchorB', 'k', 'damping',
+    'contacts'])
+LoadDef = namedtuple('LoadDef', ['body', 'anchor', 'max', 'label', 'force'])
+ControllerDef = namedtuple('ControllerDef', [
+    'elastic', 'label', 'limit', 'max_speed', 'max_force', 'target'])
+CoupledDef = namedtuple('CoupledDef', ['extensor', 'flexor', 'label'])
+LabelDef = namedtuple('LabelDef', ['pos', 'text'])
+
+ground_def = BodyDef('_ground', 'box', (0, -4), 10, 3, default_density,
+                     default_friction, default_restitution, True,
+                     tuple(default_color), None, None, None, None)
+
+# The config defaults compiled into every scene (the ground body included),
+# which are part of the cache key
+compiled_defaults = repr((default_density, default_friction,
+                          default_restitution,
+                          tuple(default_color))).encode('utf-8')
+
+
+def vector(value):
+    return None if value is None else tuple(value)
+
+
+class CompiledScene(object):
+    '''A validated scene, ready to be built into a Simulation without any
+    further lookups. The ground body is always body 0.'''
+
+    def __init__(self):
+        self.bodies = [ground_def]
+        self.joints = []
+        self.elastics = []
+        self.loads = []
+        self.controllers = []
+        self.coupled = []
+        self.labels = []
+        self.bodyIds = {'_ground': 0}
+        self.jointIds = {}
+        self.elasticIds = {}
+        self.controllerIds = {}
+
+    def lookup(self, ids, name, kind):
+        try:
+            return ids[name]
+        except KeyError:
+            raise Exception('Unknown {0} {1}'.format(kind, name))
+
+    # Entry lists and their types, and id lookups, as saved by toJson
+    entry_types = (('bodies', BodyDef), ('joints', JointDef),
+                   ('elastics', ElasticDef), ('loads', LoadDef),
+                   ('controllers', ControllerDef), ('coupled', CoupledDef),
+                   ('labels', LabelDef))
+    id_names = ('bodyIds', 'jointIds', 'elasticIds', 'controllerIds')
+
+    def toJson(self):
+        '''The scene as plain JSON data. Ids are saved as [id, index] pairs,
+        as they need not be strings.'''
+        data = {name: getattr(self, name) for name, kind in self.entry_types}
+        for name in self.id_names:
+            data[name] = list(getattr(self, name).items())
+        return data
+
+    @classmethod
+    def fromJson(cls, data):
+        '''Rebuilds a scene saved by toJson, with its tuples restored.'''
+        scene = cls()
+        for name, kind in cls.entry_types:
+            setattr(scene, name,
+                    [kind(*toTuples(entry)) for entry in data[name]])
+        for name in cls.id_names:
+            setattr(scene, name,
+                    {toTuples(id): index for id, index in data[name]})
+        return scene
+
+
+def toTuples(value):
+    '''JSON lists, back to the tuples they were compiled as.'''
+    if isinstance(value, list):
+        return tuple(toTuples(v) for v in value)
+    return value
+
+
+def compileScene(parsed):
+    '''Validates a parsed scene description, and compiles it.'''
+    scene = CompiledScene()
+
+    for body in parsed.get('bodies', []):
+        type = body.get('type', 'box')
+        if type == 'box':
+            width, height = body['width'], body['height']
+        elif type == 'circle':
+            width = height = body['radius']
+        else:
+            raise Exception('Unknown body type {0}'.format(type))
+        if 'id' in body:
+            scene.bodyIds[body['id']] = len(scene.bodies)
+        scene.bodies.append(BodyDef(
+            body.get('id'), type, tuple(body['pos']), width, height,
+            body.get('density', default_density),
+            body.get('friction', default_friction),
+            body.get('restitution', default_restitution),
+            body.get('static', False),
+            tuple(body.get('color', default_color)),
+            body.get('label', None),
+            body.get('mass', None),
+            body.get('inertia', None),
+            vector(body.get('cog', None))))
+
+    for joint in parsed.get('joints', []):
+        type = joint['type']
+        if type != 'revolute':
+            raise Exception('Unknown joint type {0}'.format(type))
+        if 'id' in joint:
+            scene.jointIds[joint['id']] = len(scene.joints)
+        scene.joints.append(JointDef(
+            joint.get('id'), type,
+            scene.lookup(scene.bodyIds, joint['bodyA'], 'body'),
+            scene.lookup(scene.bodyIds, joint['bodyB'], 'body'),
+            tuple(joint['anchor']),
+            joint.get('enableLimit', False),
+            joint.get('lowerAngle', 0.0),
+            joint.get('upperAngle', 0.0),
+            joint.get('collideConnected', False),
+            joint.get('maxMotorTorque', 0.0),
+            joint.get('motorSpeed', 0.0),
+            joint.get('enableMotor', False),
+            joint.get('referenceAngle', 0.0)))
+
+    for elastic in parsed.get('elastics', []):
+        model = elastic.get('model', 'linear')
+        if model not in ('linear', 'cubic'):
+            raise Exception('Unknown elastic model {0}'.format(model))
+        contacts = tuple(
+            (scene.lookup(scene.bodyIds, contact['body'], 'body'),
+             tuple(contact['point']))
+            for contact in elastic.get('contacts', []))
+        if 'id' in elastic:
+            scene.elasticIds[elastic['id']] = len(scene.elastics)
+        scene.elastics.append(ElasticDef(
+            elastic.get('id'), model,
+            scene.lookup(scene.bodyIds, elastic['bodyA'], 'body'),
+            scene.lookup(scene.bodyIds, elastic['bodyB'], 'body'),
+            tuple(elastic['anchorA']), tuple(elastic['anchorB']),
+            elastic.get('k', 1), elastic.get('damping', 1), contacts))
+
+    for load in parsed.get('loads', []):
+        scene.loads.append(LoadDef(
+            scene.lookup(scene.bodyIds, load['body'], 'body'),
+            tuple(load['anchor']),
+            load.get('max', 500),
+            load.get('label', 'Unnamed Load'),
+            load.get('force', None)))
+
+    for controller in parsed.get('tendon-controllers', []):
+        scene.controllerIds[controller['elastic']] = len(scene.controllers)
+        scene.controllers.append(ControllerDef(
+            scene.lookup(scene.elasticIds, controller['elastic'], 'elastic'),
+            controller['label'],
+            controller.get('limit', 100),
+            controller.get('max-speed', 50),
+            controller.get('max-force', 5000),
+            controller.get('target', None)))
+
+    for coupled in parsed.get('coupled-controllers', []):
+        scene.coupled.append(CoupledDef(
+            scene.lookup(scene.controllerIds, coupled['extensor'],
+                         'tendon controller'),
+            scene.lookup(scene.controllerIds, coupled['flexor'],
+                         'tendon controller'),
+            coupled['label']))
+
+    for label in parsed.get('labels', []):
+        scene.labels.append(LabelDef(tuple(label['pos']), label['text']))
+
+    return scene
+
+
+def readSceneFile(filePath):
+    '''Returns the contents of a scene file, as bytes.'''
+    try:
+        logger.info('Loading %s', filePath)
+        with open(filePath, 'rb') as f:
+            return f.read()
+    except IOError as e:
+        logger.error('%s', e)
+        raise
+
+
+def loadSceneFile(filePath):
+    '''Reads and parses a YAML scene file.'''
+    return yaml.load(readSceneFile(filePath), Loader=SafeLoader)
+
+
+# Compiled scenes already loaded by this process, by cache key
+compiled_scenes = {}
+
+
+def loadScene(filePath):
+    '''Returns the compiled scene for a file. Compiled scenes are cached in
+    memory and on disk, keyed by a hash of the file's contents and of the
+    defaults compiled into them, so a file is only parsed again after it (or
+    a default) has been edited. Cache files are JSON, never unpickled, so
+    that whoever can write to the cache directory can't run code with
+    them.'''
+    content = readSceneFile(filePath)
+    key = hashlib.sha1(cache_version + compiled_defaults +
+                       content).hexdigest()
+    if key in compiled_scenes:
+        return compiled_scenes[key]
+    cachePath = os.path.join(scene_cache_dir, key + '.json')
+    try:
+        with open(cachePath) as f:
+            scene = CompiledScene.fromJson(json.load(f))
+    except Exception:
+        # Missing, truncated or stale cache files are simply recompiled
+        scene = compileScene(yaml.load(content, Loader=SafeLoader))
+        try:
+            os.makedirs(scene_cache_dir, exist_ok=True)
+            with open(cachePath, 'w') as f:
+                json.dump(scene.toJson(), f)
+        except IOError:
+            # The cache is an optimisation only
+            pass
+    compiled_scenes[key] = scene
+    return scene
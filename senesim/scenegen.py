@@ -0,0 +1,165 @@
+'''Synthetic scenes: generates large scene files for scaling tests.
+
+    python -m senesim.scenegen --fingers 100 --tendons 400 --contacts 6 \
+        --loads 20 --coupled 50 --out big.yml
+
+Fingers are chains of revolute-jointed links, as in finger.yml, laid out
+on a grid. Tendons run from static anchors at the base of a finger, over
+routing contacts on its links, to one of its links. The same options and
+seed always give the same scene.
+'''
+import argparse
+import math
+import random
+
+import yaml
+
+# Decimal places kept for generated coordinates
+precision = 4
+
+
+def generateScene(fingers=10, links=3, tendons=None, contacts=2, loads=0,
+                  coupled=0, seed=0):
+    '''Returns a parsed scene (as loadSceneFile would) with the given number
+    of fingers of links each, tendons with contacts routing contacts each
+    (two per finger by default, shared out between fingers in turn), and
+    tendon controllers for all of them. coupled of the tendon pairs on a
+    finger (upper and lower) get a coupled controller, and loads loads are
+    hung from random links.'''
+    if tendons is None:
+        tendons = 2 * fingers
+    if fingers < 1 or links < 1:
+        raise Exception('A scene needs at least one finger of one link')
+    rng = random.Random(seed)
+
+    def point(x, y):
+        return [round(x, precision), round(y, precision)]
+
+    # Link half widths, per finger
+    widths = [[rng.uniform(0.1, 0.25) for j in range(links)]
+              for i in range(fingers)]
+    length = 2 * max(sum(finger) for finger in widths)
+    columns = int(math.ceil(math.sqrt(fingers)))
+    # Fingers curl upwards by at most their length
+    spacing_x = length + 0.8
+    spacing_y = length + 0.5
+
+    scene = {'bodies': [], 'joints': [], 'elastics': [],
+             'tendon-controllers': []}
+    # Link (id, left end, right end) per finger, and its base point
+    chains = []
+    for i in range(fingers):
+        x0 = (i % columns) * spacing_x
+        y0 = (i // columns) * spacing_y
+        color = [round(rng.uniform(0.6, 1), 2) for c in range(3)]
+        chain = []
+        x = x0 + 0.1
+        for j, width in enumerate(widths[i]):
+            name = 'f{0}-link{1}'.format(i, j)
+            scene['bodies'].append({
+                'id': name, 'pos': point(x + width, y0),
+                'width': round(width, precision), 'height': 0.1,
+                'color': list(color)})
+            scene['joints'].append({
+                'type': 'revolute',
+                'bodyA': chain[-1][0] if chain else '_ground',
+                'bodyB': name, 'anchor': point(x, y0),
+                'enableMotor': True,
+                'maxMotorTorque': 0.1 if j < links - 1 else 0.05,
+                'motorSpeed': 0, 'enableLimit': True,
+                'lowerAngle': 0.05, 'upperAngle': 0.4})
+            chain.append((name, x, x + 2 * width))
+            x += 2 * width
+        for side, sign in (('upper', 1), ('lower', -1)):
+            scene['bodies'].append({
+                'id': 'f{0}-{1}-anchor'.format(i, side), 'type': 'circle',
+                'pos': point(x0 - 0.2, y0 + sign * 0.1), 'radius': 0.1,
+                'static': True})
+        chains.append((chain, x0, y0))
+
+    # Pairs of tendons (upper, lower) per finger, in order
+    pairs = {}
+    for n in range(tendons):
+        i = n % fingers
+        k = n // fingers
+        side, sign = ('upper', 1) if k % 2 == 0 else ('lower', -1)
+        chain, x0, y0 = chains[i]
+        # Successive pairs insert one link further from the tip
+        insertion = links - 1 - (k // 2) % links
+        name, left, right = chain[insertion]
+        # Contacts spread evenly from the base to the insertion link, on
+        # the tendon's side of the links
+        end = left if insertion > 0 else (left + right) / 2
+        route = []
+        for c in range(contacts):
+            x = x0 + 0.1 + (end - x0 - 0.1) * (c + 0.5) / contacts
+            body = next(link for link in chain if link[1] <= x < link[2])
+            route.append({'body': body[0],
+                          'point': point(x, y0 + sign * 0.1)})
+        elastic = 'f{0}-{1}-{2}'.format(i, side, k // 2)
+        scene['elastics'].append({
+            'id': elastic,
+            'bodyA': 'f{0}-{1}-anchor'.format(i, side),
+            'bodyB': name,
+            'anchorA': point(x0, y0 + sign * 0.2),
+            'anchorB': point(right, y0 + sign * 0.1),
+            'k': round(rng.uniform(0.5, 2), 2),
+            'contacts': route})
+        scene['tendon-controllers'].append({
+            'elastic': elastic,
+            'label': 'Finger {0} {1} {2}'.format(i, side, k // 2)})
+        pairs.setdefault((i, k // 2), []).append(elastic)
+
+    scene['coupled-controllers'] = [
+        {'extensor': pair[0], 'flexor': pair[1],
+         'label': 'Finger {0} {1}'.format(i, k)}
+        for (i, k), pair in sorted(pairs.items())
+        if len(pair) == 2][:coupled]
+
+    scene['loads'] = []
+    for n in range(loads):
+        chain, x0, y0 = chains[rng.randrange(fingers)]
+        name, left, right = rng.choice(chain)
+        scene['loads'].append({
+            'body': name, 'anchor': point(right, y0),
+            'max': 100, 'label': 'Load {0}'.format(n)})
+    return scene
+
+
+def writeScene(parsed, path):
+    with open(path, 'w') as f:
+        yaml.safe_dump(parsed, f, default_flow_style=None, sort_keys=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m senesim.scenegen',
+        description='Generate a large scene for scaling tests.')
+    parser.add_argument('--fingers', type=int, default=10,
+                        help='Number of fingers')
+    parser.add_argument('--links', type=int, default=3,
+                        help='Links per finger')
+    parser.add_argument('--tendons', type=int, default=None,
+                        help='Number of tendons (default: two per finger)')
+    parser.add_argument('--contacts', type=int, default=2,
+                        help='Routing contacts per tendon')
+    parser.add_argument('--loads', type=int, default=0,
+                        help='Number of loads')
+    parser.add_argument('--coupled', type=int, default=0,
+                        help='Number of coupled controllers')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed')
+    parser.add_argument('--out', default='generated.yml',
+                        help='Output scene file')
+    args = parser.parse_args(argv)
+
+    parsed = generateScene(args.fingers, args.links, args.tendons,
+                           args.contacts, args.loads, args.coupled,
+                           args.seed)
+    writeScene(parsed, args.out)
+    print('Wrote {0}: {1} bodies, {2} elastics'.format(
+        args.out, len(parsed['bodies']), len(parsed['elastics'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+from time import perf_counter
+
+from senesim.config import *
+
+
+class FixedStepScheduler(object):
+    '''Fixed-timestep accumulator. Real time elapsed between ticks, scaled by
+    the target real-time factor, is banked and paid out as whole physics
+    steps of delta_t. If more than max_steps are due in one tick the backlog
+    is dropped, so slow machines run the simulation slower than real time
+    instead of falling further and further behind.'''
+
+    def __init__(self, delta_t=1 / world_fps,
+                 realtime_factor=world_realtime_factor,
+                 max_steps=world_max_substeps_per_tick):
+        self.delta_t = delta_t
+        self.realtimeFactor = realtime_factor
+        self.maxSteps = max_steps
+        self.skipped = 0
+        self.reset()
+
+    def reset(self, now=None):
+        '''Restarts timing from now, e.g. after a pause.'''
+        self.last = perf_counter() if now is None else now
+        self.accumulator = 0
+
+    def stepsDue(self, now=None):
+        '''Returns the number of physics steps to take for this tick.'''
+        if now is None:
+            now = perf_counter()
+        self.accumulator += (now - self.last) * self.realtimeFactor
+        self.last = now
+        steps = int(self.accumulator / self.delta_t)
+        if steps > self.maxSteps:
+            # Can't keep up - drop the backlog
+            steps = self.maxSteps
+            self.accumulator = 0
+            self.skipped += 1
+        else:
+            self.accumulator -= steps * self.delta_t
+        return steps
+
+
+class RateMeter(object):
+    '''Measures how fast a simulation runs against real time: substeps per
+    second, and the real-time factor (simulated seconds per second), both
+    averaged over the last interval seconds of running. They are None until
+    the first interval is over. Substeps are counted in units of delta_t, as
+    passed to Simulation.advance.'''
+
+    def __init__(self, delta_t=1 / world_fps, interval=rate_meter_interval):
+        self.delta_t = delta_t
+        self.interval = interval
+        self.substepsPerSecond = None
+        self.realtimeFactor = None
+        self.reset()
+
+    def reset(self, now=None):
+        '''Restarts the current interval from now, e.g. after a pause, so
+        that time spent not running isn't counted.'''
+        self.start = perf_counter() if now is None else now
+        self.substeps = 0
+
+    def add(self, substeps, now=None):
+        '''Counts substeps just run.'''
+        if now is None:
+            now = perf_counter()
+        self.substeps += substeps
+        elapsed = now - self.start
+        if elapsed >= self.interval:
+            self.substepsPerSecond = self.substeps / elapsed
+            self.realtimeFactor = self.substepsPerSecond * self.delta_t
+            self.reset(now)
@@ -0,0 +1,363 @@
+from Box2D import *
+
+from senesim.scene import *
+from senesim.config import *
+from senesim.controller import *
+from senesim.recording import TrajectoryRecorder
+from senesim.checkpoint import Checkpoint
+from senesim.stepsize import AdaptiveStepSize
+from senesim.scenecache import compileScene, loadScene
+
+
+class Simulation(object):
+    '''Headless simulation core. Owns the Box2D world and every constraint
+    and controller acting on it, loads YAML scenes and steps them without
+    creating any graphics. A Window can attach to it as a viewer.'''
+
+    def __init__(self, filePath=None):
+        self.world = b2World(warmStarting=world_warm_start)
+        self.filePath = filePath
+        self.groundBody = None
+        # Bodies in creation order, and by scene id
+        self.bodies = []
+        self.bodyIds = {}
+        self.joints = []
+        self.jointIds = {}
+        self.constraints = []
+        self.controllers = []
+        self.elastics = {}
+        self.tendonControllers = {}
+        self.coupledControllers = []
+        self.loads = []
+        # Scene labels as (pos, text); these only matter to a viewer
+        self.labels = []
+        # The compiled scene, and (scene entry, object) for each body,
+        # elastic and load built from it
+        self.compiled = None
+        self.sceneObjects = []
+        self.step_n = 0
+        # Vectorized force computation for elastics, built on first step
+        self.elasticBatch = None
+        # Vectorized tendon controller updates, built on first step
+        self.controllerBatch = None
+        self.recorder = None
+        # Set when the next step must not be warm started (see Checkpoint)
+        self.coldStart = False
+        # Times the phases of each step, when set (see setProfiler)
+        self.profiler = None
+        # Chooses substep lengths in advance, when set (see setAdaptiveStep)
+        self.stepSize = None
+        self.setAdaptiveStep(world_adaptive_step)
+        if filePath is not None:
+            self.reset()
+
+    def clear(self):
+        self.stopRecording()
+        for constraint in self.constraints:
+            constraint.cleanup()
+        self.constraints.clear()
+        self.controllers.clear()
+        for body in self.world.bodies:
+            body.userData.cleanup()
+        self.groundBody = None
+        self.bodies.clear()
+        self.bodyIds.clear()
+        self.joints.clear()
+        self.jointIds.clear()
+        self.elastics.clear()
+        self.tendonControllers.clear()
+        self.coupledControllers.clear()
+        self.loads.clear()
+        self.labels.clear()
+        self.sceneObjects = []
+        self.step_n = 0
+        self.elasticBatch = None
+        self.controllerBatch = None
+
+    def load(self, filePath):
+        self.filePath = filePath
+        self.reset()
+
+    def reset(self):
+        '''Regenerates the world from the scene file.'''
+        self.buildCompiled(loadScene(self.filePath))
+
+    def build(self, parsed):
+        '''Generates the world, including all bodies, joints, and elastics,
+        from a parsed scene description.'''
+        self.buildCompiled(compileScene(parsed))
+
+    def buildCompiled(self, compiled):
+        '''Generates the world from a compiled scene (see scenecache).'''
+        self.clear()
+        self.compiled = compiled
+
+        bodies = []
+        for entry in compiled.bodies:
+            new_body = self.addBody()
+            if entry.type == 'box':
+                new_body.initBox(entry.pos, entry.width, entry.height,
+                                 density=entry.density,
+                                 restitution=entry.restitution,
+                                 friction=entry.friction, static=entry.static,
+                                 label=entry.label, color=entry.color)
+            else:
+                new_body.initCircle(entry.pos, entry.width,
+                                    density=entry.density,
+                                    restitution=entry.restitution,
+                                    friction=entry.friction,
+                                    static=entry.static,
+                                    label=entry.label, color=entry.color)
+            # Set mass properties, if provided
+            if entry.mass is not None:
+                new_body.body.mass = entry.mass
+            if entry.inertia is not None:
+                new_body.body.inertia = entry.inertia
+            if entry.cog is not None:
+                new_body.body.localCenter = entry.cog
+            bodies.append(new_body)
+            self.sceneObjects.append((entry, new_body))
+        self.groundBody = bodies[0]
+        # Allows retrieval by ID for joints etc
+        self.bodyIds.update(
+            (id, bodies[n]) for id, n in compiled.bodyIds.items())
+
+        for entry in compiled.joints:
+            new_joint = self.world.CreateRevoluteJoint(
+                bodyA=bodies[entry.bodyA].body,
+                bodyB=bodies[entry.bodyB].body,
+                anchor=entry.anchor,
+                enableLimit=entry.enableLimit,
+                lowerAngle=entry.lowerAngle * b2_pi,
+                upperAngle=entry.upperAngle * b2_pi,
+                collideConnected=entry.collideConnected,
+                maxMotorTorque=entry.maxMotorTorque,
+                motorSpeed=entry.motorSpeed,
+                enableMotor=entry.enableMotor,
+                referenceAngle=entry.referenceAngle * b2_pi)
+            self.joints.append(new_joint)
+            if entry.id is not None:
+                self.jointIds[entry.id] = new_joint
+
+        elastics = []
+        for entry in compiled.elastics:
+            if entry.model == 'cubic':
+                new_elastic = CubicElastic(self.world)
+            else:
+                new_elastic = Elastic(self.world)
+            new_elastic.initElastic(
+                bodies[entry.bodyA].body,
+                bodies[entry.bodyB].body,
+                entry.anchorA,
+                entry.anchorB,
+                entry.k, damping=entry.damping)
+            for body, point in entry.contacts:
+                new_elastic.addContact(bodies[body].body, point)
+            self.addConstraint(new_elastic)
+            elastics.append(new_elastic)
+            self.sceneObjects.append((entry, new_elastic))
+            if entry.id is not None:
+                self.elastics[entry.id] = new_elastic
+
+        for entry in compiled.loads:
+            new_load = Load(self.world, bodies[entry.body].body, entry.anchor,
+                            entry.max, label=entry.label)
+            if entry.force is not None:
+                new_load.setForceMagnitude(entry.force)
+            self.loads.append(new_load)
+            self.addConstraint(new_load)
+            self.sceneObjects.append((entry, new_load))
+
+        controllers = []
+        for entry in compiled.controllers:
+            new_controller = TendonController(elastics[entry.elastic],
+                                              entry.label,
+                                              limit=entry.limit,
+                                              max_force=entry.max_force,
+                                              max_speed=entry.max_speed)
+            if entry.target is not None:
+                new_controller.setTarget(entry.target)
+            self.addTendonController(new_controller)
+            controllers.append(new_controller)
+        self.tendonControllers.update(
+            (id, controllers[n]) for id, n in compiled.controllerIds.items())
+
+        for entry in compiled.coupled:
+            new_controller = CoupledTendonController(
+                controllers[entry.extensor], controllers[entry.flexor],
+                entry.label)
+            self.coupledControllers.append(new_controller)
+
+        for entry in compiled.labels:
+            self.labels.append((entry.pos, entry.text))
+
+    def addBody(self):
+        new_body = Body(self.world)
+        self.bodies.append(new_body)
+        return new_body
+
+    def addConstraint(self, constraint):
+        self.constraints.append(constraint)
+        self.elasticBatch = None
+
+    def addTendonController(self, controller):
+        self.controllers.append(controller)
+        self.controllerBatch = None
+
+    def buildElasticBatch(self):
+        '''Moves all elastics into an ElasticBatch, if enabled, numpy is
+        available and their paths have at least world_batch_elastics_min
+        segments in all (an elastic with n contacts has n + 1). Below that,
+        numpy's per-call overhead outweighs what it saves, and each elastic
+        is updated on its own, as are other constraints.'''
+        elastics = [c for c in self.constraints if isinstance(c, Elastic)]
+        segments = sum(len(e.contacts) + 1 for e in elastics)
+        if (world_batch_elastics and ElasticBatch.available and elastics and
+                segments >= world_batch_elastics_min):
+            self.elasticBatch = ElasticBatch(elastics)
+            self.unbatchedConstraints = [c for c in self.constraints
+                                         if not isinstance(c, Elastic)]
+        else:
+            self.elasticBatch = False
+            self.unbatchedConstraints = self.constraints
+
+    def buildControllerBatch(self):
+        '''Moves the tendon controllers that can be batched (see
+        ControllerBatch) into a ControllerBatch, if enabled, numpy is
+        available and there are at least world_batch_controllers_min of them;
+        with fewer, the batch barely breaks even. Others are still updated one
+        by one.'''
+        batched = [c for c in self.controllers if ControllerBatch.canBatch(c)]
+        if (world_batch_controllers and ControllerBatch.available and
+                len(batched) >= world_batch_controllers_min):
+            self.controllerBatch = ControllerBatch(batched)
+            self.unbatchedControllers = [c for c in self.controllers
+                                         if not ControllerBatch.canBatch(c)]
+        else:
+            self.controllerBatch = False
+            self.unbatchedControllers = self.controllers
+
+    def invalidateControllers(self):
+        '''Call after setting controller state directly rather than through
+        the controllers' setters: the ControllerBatch, which keeps its own
+        copy of that state, is rebuilt from the controllers.'''
+        self.controllerBatch = None
+
+    def invalidateGeometry(self):
+        '''Refreshes cached constraint geometry after bodies have moved.'''
+        if self.elasticBatch:
+            for constraint in self.unbatchedConstraints:
+                constraint.invalidateGeometry()
+            self.elasticBatch.updateGeometry()
+        else:
+            for constraint in self.constraints:
+                constraint.invalidateGeometry()
+
+    def step(self, delta_t=1 / world_fps):
+        '''Advances the simulation by a single substep.'''
+        if self.profiler is not None:
+            self.profiledStep(delta_t)
+            return
+        self.updateControllers(delta_t)
+        self.updateForces(delta_t)
+        self.stepWorld(delta_t)
+        self.invalidateGeometry()
+        self.clearForces()
+        self.step_n += 1
+
+    def profiledStep(self, delta_t):
+        '''As step, timing each phase with the profiler.'''
+        time = self.profiler.time
+        time('controllers', self.updateControllers, delta_t)
+        time('forces', self.updateForces, delta_t)
+        time('world_step', self.stepWorld, delta_t)
+        time('geometry', self.invalidateGeometry)
+        time('clear_forces', self.clearForces)
+        self.step_n += 1
+
+    def updateControllers(self, delta_t):
+        '''Controllers adjust their elastics.'''
+        if self.controllerBatch is None:
+            self.buildControllerBatch()
+        if self.controllerBatch:
+            self.controllerBatch.update(delta_t, self.elasticBatch)
+        for controller in self.unbatchedControllers:
+            controller.update(delta_t)
+
+    def updateForces(self, delta_t):
+        '''Constraints apply their forces.'''
+        if self.elasticBatch is None:
+            self.buildElasticBatch()
+        if self.elasticBatch:
+            self.elasticBatch.updateForces(delta_t)
+        for constraint in self.unbatchedConstraints:
+            constraint.updateForces(delta_t)
+
+    def stepWorld(self, delta_t):
+        '''The Box2D step itself.'''
+        if self.coldStart:
+            self.world.warmStarting = False
+        self.world.Step(
+            delta_t,
+            world_iterations,
+            world_iterations)
+        if self.coldStart:
+            self.world.warmStarting = world_warm_start
+            self.coldStart = False
+
+    def clearForces(self):
+        if world_clear_forces:
+            self.world.ClearForces()
+
+    def advance(self, n=world_outer_iterations, delta_t=1 / world_fps):
+        '''Advances the simulation by n substeps (one frame by default). With
+        adaptive steps, the same simulated time is covered by as many steps
+        as the step size estimate asks for. Nothing happens for n = 0: no
+        frame is recorded or profiled.'''
+        if n <= 0:
+            return
+        if self.stepSize is not None:
+            self.stepSize.advance(n * delta_t)
+        else:
+            for i in range(n):
+                self.step(delta_t)
+        self.endFrame()
+
+    def endFrame(self):
+        '''Marks the end of a frame, for anything that works per frame rather
+        than per substep.'''
+        if self.recorder is not None:
+            self.recorder.record()
+        if self.profiler is not None:
+            self.profiler.endFrame()
+
+    def setAdaptiveStep(self, enabled):
+        '''Switches between fixed substeps and substeps chosen per step from
+        a stability estimate (see AdaptiveStepSize).'''
+        self.stepSize = AdaptiveStepSize(self) if enabled else None
+
+    def setProfiler(self, profiler):
+        '''Starts timing the phases of each step with a Profiler, or stops
+        if profiler is None.'''
+        self.profiler = profiler
+
+    def checkpoint(self):
+        '''Captures the current state, to be restored later (see
+        Checkpoint).'''
+        return Checkpoint(self)
+
+    def restore(self, checkpoint):
+        '''Returns to a state captured by checkpoint(), without rebuilding
+        the scene.'''
+        checkpoint.restore(self)
+
+    def startRecording(self, path):
+        '''Records the trajectory to path, one record per frame, until
+        stopRecording or the scene is cleared.'''
+        self.stopRecording()
+        self.recorder = TrajectoryRecorder(self, path)
+
+    def stopRecording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
@@ -0,0 +1,125 @@
+import math
+
+from Box2D import *
+
+from senesim.config import *
+from senesim.scene import Elastic
+
+
+def getInverseMass(body, point, direction):
+    '''Inverse of the effective mass of body at a world point, along a unit
+    direction. A body pinned to a static body by a revolute joint can only
+    turn about the pin; otherwise it is treated as free, which is the
+    conservative (lighter) choice for bodies in a chain.'''
+    if body.mass == 0:
+        return 0.0
+    for edge in body.joints:
+        joint = edge.joint
+        if isinstance(joint, b2RevoluteJoint) and edge.other.mass == 0:
+            pivot = joint.anchorA
+            r = point - pivot
+            d = body.worldCenter - pivot
+            arm = r.x * direction.y - r.y * direction.x
+            return arm * arm / (body.inertia + body.mass * (d.x * d.x +
+                                                            d.y * d.y))
+    r = point - body.worldCenter
+    arm = r.x * direction.y - r.y * direction.x
+    return 1 / body.mass + arm * arm / body.inertia
+
+
+class AdaptiveStepSize(object):
+    '''Chooses the length of each substep, instead of the fixed 1/world_fps.
+
+    Elastic forces are explicit: the tension is applied for a whole step,
+    with its damping from the extension rate over the last one, and Box2D
+    then integrates velocities before positions. For stiffness k and
+    damping c acting on an effective mass m (in scene units, hence
+    world_scale), with w2 = k / m and g = c / m, that is stable for
+    w2 dt^2 + 2 g dt < 4. The effective mass is that of the path's length,
+    moved by each point along the sum of the directions to its neighbours.
+    A contact that the path runs straight over hardly counts. This bound is
+    estimated once per frame. Each step is also short enough that no point
+    of a body travels further than max_travel, which keeps collisions and
+    joints accurate while things move fast. Near rest, steps grow up to
+    max_step. Steps are never shorter than min_step, by default the fixed
+    1/world_fps, so adaptive stepping never takes more steps than fixed.
+
+    advance always simulates exactly the requested time, splitting it into
+    equal steps no longer than the current limit.'''
+
+    def __init__(self, sim, min_step=adaptive_min_step,
+                 max_step=adaptive_max_step, safety=adaptive_safety,
+                 max_travel=adaptive_max_travel):
+        self.sim = sim
+        self.minStep = min_step
+        self.maxStep = max_step
+        self.safety = safety
+        self.maxTravel = max_travel
+        self.stiffnessLimit = max_step
+        # Substeps and simulated time covered by the last advance
+        self.steps = 0
+        self.duration = 0
+
+    def getStiffnessLimit(self):
+        '''Longest stable step for the elastics, in their current pose.'''
+        limit = self.maxStep
+        for constraint in self.sim.constraints:
+            if not isinstance(constraint, Elastic):
+                continue
+            points = constraint.getWorldPoints()
+            inverse_mass = 0.0
+            for i, body in enumerate(constraint.getBodies()):
+                # How the path's length changes as this point moves
+                gradient = b2Vec2(0, 0)
+                for j in (i - 1, i + 1):
+                    if 0 <= j < len(points):
+                        direction = points[j] - points[i]
+                        if direction.Normalize() > b2_epsilon:
+                            gradient += direction
+                size = gradient.Normalize()
+                if size > b2_epsilon:
+                    inverse_mass += size * size * getInverseMass(
+                        body, points[i], gradient)
+            stiffness = abs(constraint.k) * world_scale * inverse_mass
+            damping = abs(constraint.damping) * world_scale * inverse_mass
+            if stiffness > 0:
+                # The root of stiffness dt^2 + 2 damping dt = 4
+                limit = min(limit, (math.sqrt(damping * damping +
+                                              4 * stiffness) - damping) /
+                            stiffness)
+            elif damping > 0:
+                limit = min(limit, 2 / damping)
+        return limit * self.safety
+
+    def getVelocityLimit(self):
+        '''Longest step in which no body point moves more than maxTravel.'''
+        fastest = 0.0
+        for body in self.sim.bodies:
+            b = body.body
+            if not b.awake or b.mass == 0:
+                continue
+            kind, width, height = body.shape
+            speed = (b.linearVelocity.length +
+                     abs(b.angularVelocity) * math.hypot(width, height))
+            fastest = max(fastest, speed)
+        if fastest * self.maxStep <= self.maxTravel:
+            return self.maxStep
+        return self.maxTravel / fastest
+
+    def advance(self, duration):
+        '''Steps the simulation through duration seconds.'''
+        sim = self.sim
+        self.stiffnessLimit = self.getStiffnessLimit()
+        self.steps = 0
+        self.duration = duration
+        remaining = duration
+        # Leftovers below this are rounding, not time to simulate
+        while remaining > self.minStep * 1e-3:
+            limit = min(self.stiffnessLimit, self.getVelocityLimit())
+            limit = max(limit, self.minStep)
+            # Equal steps through the rest of the frame, so the last step is
+            # not a sliver
+            delta_t = remaining / math.ceil(remaining / limit - 1e-9)
+            sim.step(delta_t)
+            remaining -= delta_t
+            self.steps += 1
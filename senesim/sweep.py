@@ -0,0 +1,206 @@
+'''Parameter sweeps: runs many variants of one scene headless, in parallel.
+
+    python -m senesim.sweep finger.yml \
+        --set elastics.upper-elastic.k=0.5,1,2 \
+        --set tendon-controllers.lower-elastic.max-force=100,1000 \
+        --steps 4000 --out results.csv
+
+Each --set gives a list of values for one scene field, and the sweep runs
+every combination of them (or the variants listed in a --variants file).
+With --equilibrium, each variant is solved for its resting pose rather than
+run (see senesim.equilibrium), which is faster for static questions where
+controllers don't have far to go. Solved joints pushed against a limit sit
+exactly on it, where stepped runs rest up to b2_angularSlop (two degrees)
+past it. Settling times aren't known for solved variants, so with
+--equilibrium the settling_time column is NaN throughout.
+'''
+import argparse
+import copy
+import csv
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+from senesim.config import *
+from senesim.equilibrium import runUntilRest, solveEquilibrium
+from senesim.scenecache import loadSceneFile
+from senesim.simulation import Simulation
+
+# The field scene entries are found by in each section, besides their index
+section_keys = {
+    'bodies': 'id',
+    'joints': 'id',
+    'elastics': 'id',
+    'tendon-controllers': 'elastic',
+    'loads': 'label',
+}
+
+
+def findEntry(parsed, section, name):
+    entries = parsed.get(section, [])
+    key = section_keys.get(section, 'id')
+    for entry in entries:
+        if str(entry.get(key)) == name:
+            return entry
+    if name.isdigit() and int(name) < len(entries):
+        return entries[int(name)]
+    raise KeyError('No {0} entry named {1}'.format(section, name))
+
+
+def applyOverrides(parsed, overrides):
+    '''Returns a copy of a parsed scene with overrides applied. Override keys
+    are 'section.name.field', e.g. 'elastics.a1.k' or 'loads.0.force', where
+    name is the entry's id (its elastic for tendon controllers, its label for
+    loads) or its index within the section.'''
+    parsed = copy.deepcopy(parsed)
+    for key, value in overrides.items():
+        section, name, field = key.split('.', 2)
+        findEntry(parsed, section, name)[field] = value
+    return parsed
+
+
+def grid(axes):
+    '''Every combination of the values in axes, a dict of override key to
+    list of values.'''
+    keys = list(axes)
+    return [dict(zip(keys, values))
+            for values in itertools.product(*(axes[k] for k in keys))]
+
+
+def runVariant(parsed, overrides, steps, equilibrium=False):
+    '''Builds and runs one variant headless, returning its results row.
+    With equilibrium, the variant is brought to rest by solveEquilibrium
+    instead, within steps substeps, and its settling time is NaN.'''
+    sim = Simulation()
+    sim.build(applyOverrides(parsed, overrides))
+    delta_t = 1 / world_fps
+    # The run ends early once the variant is at rest
+    if equilibrium:
+        settled = solveEquilibrium(sim, steps)
+        settled_at = None
+    else:
+        settled_at = runUntilRest(sim, steps, delta_t)
+        settled = settled_at is not None
+
+    row = dict(overrides)
+    for name, elastic in sim.elastics.items():
+        row['tension.{0}'.format(name)] = elastic.getInternalForce(delta_t)
+    names = {joint: name for name, joint in sim.jointIds.items()}
+    for n, joint in enumerate(sim.joints):
+        row['angle.{0}'.format(names.get(joint, n))] = joint.angle
+    row['settled'] = settled
+    row['settling_time'] = (settled_at * delta_t if settled_at is not None
+                            else float('nan'))
+    return row
+
+
+def sweep(filePath, variants, steps=4000, processes=None,
+          equilibrium=False):
+    '''Runs each variant (a dict of overrides) of the scene for the given
+    number of substeps, or solves it for equilibrium, on a pool of processes
+    (one per core by default). Returns the result rows in variant order.'''
+    parsed = loadSceneFile(filePath)
+    n = len(variants)
+    if processes == 1:
+        rows = [runVariant(parsed, v, steps, equilibrium) for v in variants]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            rows = list(executor.map(runVariant, [parsed] * n, variants,
+                                     [steps] * n, [equilibrium] * n))
+    for i, row in enumerate(rows):
+        row['variant'] = i
+    return rows
+
+
+def toColumns(rows):
+    columns = {'variant': []}
+    for row in rows:
+        for key in row:
+            columns.setdefault(key, [])
+    for row in rows:
+        for key, values in columns.items():
+            values.append(row.get(key))
+    return columns
+
+
+def toArrays(columns):
+    '''Columns as numpy arrays that load without pickling. Values missing
+    from numeric columns become NaN; other columns hold strings, with ''
+    for missing values and a boolean '<column>.missing' array beside them.'''
+    import numpy as np
+    arrays = {}
+    for key, values in columns.items():
+        present = [v for v in values if v is not None]
+        if all(isinstance(v, (int, float)) for v in present):
+            if len(present) < len(values):
+                values = [float('nan') if v is None else v for v in values]
+            arrays[key] = np.array(values)
+        else:
+            arrays[key] = np.array(['' if v is None else str(v)
+                                    for v in values])
+            if len(present) < len(values):
+                arrays[key + '.missing'] = np.array(
+                    [v is None for v in values])
+    return arrays
+
+
+def writeResults(rows, path):
+    '''Writes result rows as columns, to .npz (with numpy) or .csv.'''
+    columns = toColumns(rows)
+    if path.endswith('.npz'):
+        import numpy as np
+        np.savez(path, **toArrays(columns))
+    else:
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(list(columns))
+            writer.writerows(zip(*columns.values()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m senesim.sweep',
+        description='Run variants of a scene headless, in parallel.')
+    parser.add_argument('scene', help='YAML scene file')
+    parser.add_argument('--set', action='append', default=[],
+                        metavar='KEY=V1,V2,...',
+                        help='Values to sweep for one field, e.g. '
+                             'elastics.a1.k=100,200')
+    parser.add_argument('--variants',
+                        help='YAML file with a list of override dicts, '
+                             'run instead of a grid')
+    parser.add_argument('--steps', type=int, default=4000,
+                        help='Substeps to run each variant for')
+    parser.add_argument('--equilibrium', action='store_true',
+                        help='Solve each variant for its resting pose '
+                             'instead of running it (see '
+                             'senesim.equilibrium); settling times are left '
+                             'NaN')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='Worker processes (default: one per core)')
+    parser.add_argument('--out', default='sweep.csv',
+                        help='Output file, .csv or .npz')
+    args = parser.parse_args(argv)
+
+    if args.variants:
+        with open(args.variants) as f:
+            variants = yaml.safe_load(f)
+    else:
+        axes = {}
+        for spec in args.set:
+            key, values = spec.split('=', 1)
+            axes[key] = [yaml.safe_load(v) for v in values.split(',')]
+        variants = grid(axes)
+
+    print('Running {0} variants on {1} processes'.format(
+        len(variants), args.processes or os.cpu_count()))
+    rows = sweep(args.scene, variants, args.steps, args.processes,
+                 args.equilibrium)
+    writeResults(rows, args.out)
+    print('Wrote {0}'.format(args.out))
+
+
+if __name__ == '__main__':
+    main()
@@ -58,3 +58,18 @@ class QSliderD(QSlider):
     # Pane full of sliders - don't want to adjust slider instead of scrolling
     def wheelEvent(self, e):
         pass
+
+
+class ProfiledGraphicsView(QGraphicsView):
+    '''QGraphicsView that adds the time it spends painting to a Profiler,
+    while one is set.'''
+    def __init__(self, *args, **kwargs):
+        super(ProfiledGraphicsView, self).__init__(*args, **kwargs)
+        self.profiler = None
+
+    def paintEvent(self, event):
+        if self.profiler is None:
+            super(ProfiledGraphicsView, self).paintEvent(event)
+        else:
+            self.profiler.time(
+                'paint', super(ProfiledGraphicsView, self).paintEvent, event)
@@ -0,0 +1,164 @@
+import threading
+from collections import deque
+from time import perf_counter, sleep
+
+from senesim.config import *
+from senesim.equilibrium import RestDetector
+from senesim.scheduler import FixedStepScheduler, RateMeter
+
+
+class CommandQueue(object):
+    '''Calls to be made on the physics thread, in order. Any thread may post;
+    only the physics thread runs them. deque.append and deque.popleft are
+    atomic, so no lock is needed.'''
+
+    def __init__(self):
+        self._queue = deque()
+
+    def post(self, function, *args):
+        self._queue.append((function, args))
+
+    def run(self):
+        '''Makes the queued calls. Returns whether there were any.'''
+        queue = self._queue
+        ran = False
+        while queue:
+            function, args = queue.popleft()
+            function(*args)
+            ran = True
+        return ran
+
+
+class Snapshot(object):
+    '''Display state of a set of scene objects (bodies, constraints, mouse
+    interaction) at one step, as returned by their getDisplayState. Objects
+    with nothing to display (a None state) are left out.'''
+
+    def __init__(self):
+        self.step_n = 0
+        self.states = {}
+
+    def capture(self, sim, objects):
+        self.step_n = sim.step_n
+        states = self.states
+        states.clear()
+        for obj in objects:
+            state = obj.getDisplayState()
+            if state is not None:
+                states[obj] = state
+
+
+class SimulationWorker(threading.Thread):
+    '''Runs a Simulation on its own thread, paced against real time by a
+    FixedStepScheduler. Once per frame it publishes a Snapshot through a
+    double buffer: the worker fills the back buffer, then swaps it to the
+    front under a lock that the GUI holds while drawing from the front.
+    Changes to the simulation from other threads must go through post().
+
+    With settle_idle, the worker also goes idle once the simulation comes to
+    rest (see RestDetector), and sleeps like a paused one until something
+    is posted.
+
+    In turbo mode the simulation isn't paced at all: whole frames run as
+    fast as they go, and a snapshot is only published turbo_refresh_fps
+    times a second. Either way, meter tells how fast it actually runs.'''
+
+    def __init__(self, sim, displayObjects=(), paused=False, turbo=False):
+        super(SimulationWorker, self).__init__(daemon=True)
+        self.sim = sim
+        self.displayObjects = list(displayObjects)
+        self.commands = CommandQueue()
+        self.scheduler = FixedStepScheduler()
+        self.meter = RateMeter(self.scheduler.delta_t)
+        self.front = Snapshot()
+        self.back = Snapshot()
+        self.fresh = False
+        self.lock = threading.Lock()
+        self.paused = paused
+        self.turbo = turbo
+        self.idle = False
+        self.detector = RestDetector(sim) if settle_idle else None
+        self._wake = threading.Event()
+        self._stopping = False
+
+    def post(self, function, *args):
+        self.commands.post(function, *args)
+        self._wake.set()
+
+    def setPaused(self, paused):
+        self.paused = paused
+        self._wake.set()
+
+    def setTurbo(self, turbo):
+        self.turbo = turbo
+        self._wake.set()
+
+    def stop(self):
+        '''Stops the thread and waits for it to finish its current frame.'''
+        self._stopping = True
+        self._wake.set()
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        period = 1 / render_fps
+        self.publish()
+        self.scheduler.reset()
+        while not self._stopping:
+            if self.paused or self.idle:
+                # Sleep until there is something to do
+                self._wake.wait()
+                self._wake.clear()
+                if self.commands.run():
+                    self.wake()
+                self.publish()
+                self.scheduler.reset()
+                self.meter.reset()
+                continue
+            start = perf_counter()
+            if self.commands.run():
+                self.wake()
+            if self.turbo:
+                self.runTurbo(start + 1 / turbo_refresh_fps)
+                # So that real-time pacing doesn't catch up afterwards
+                self.scheduler.reset()
+                self.publish()
+                continue
+            steps = self.scheduler.stepsDue(start)
+            self.sim.advance(steps, self.scheduler.delta_t)
+            self.meter.add(steps)
+            if self.commands.run():
+                self.wake()
+            elif self.detector is not None:
+                self.idle = self.detector.update()
+            self.publish()
+            remaining = period - (perf_counter() - start)
+            if remaining > 0:
+                sleep(remaining)
+
+    def runTurbo(self, deadline):
+        '''Runs whole frames, as fast as they go, until deadline (a
+        perf_counter time) or until the simulation comes to rest. Posted
+        changes are still made between frames.'''
+        delta_t = self.scheduler.delta_t
+        while perf_counter() < deadline and self.turbo:
+            self.sim.advance(world_outer_iterations, delta_t)
+            self.meter.add(world_outer_iterations)
+            if self.commands.run():
+                self.wake()
+            elif self.detector is not None:
+                self.idle = self.detector.update()
+                if self.idle:
+                    break
+
+    def wake(self):
+        '''Resumes stepping after an input changed the simulation.'''
+        self.idle = False
+        if self.detector is not None:
+            self.detector.reset()
+
+    def publish(self):
+        self.back.capture(self.sim, self.displayObjects)
+        with self.lock:
+            self.front, self.back = self.back, self.front
+            self.fresh = True
@@ -0,0 +1,55 @@
+import os
+import time
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+from PyQt5.QtWidgets import QApplication
+
+import senesim.app
+from senesim import Simulation, TrajectoryRecorder
+from senesim.app import Window
+from senesim.config import world_fps, world_outer_iterations
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def runFor(app, seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        app.processEvents()
+        time.sleep(0.001)
+
+
+@pytest.mark.parametrize('threaded', [False, True])
+def test_reset_after_playback_steps(app, tmp_path, monkeypatch, threaded):
+    monkeypatch.setattr(senesim.app, 'gui_threaded_physics', threaded)
+    scene = os.path.join(root, 'rope.yml')
+    sim = Simulation()
+    sim.load(scene)
+    path = str(tmp_path / 'rope.senerec')
+    recorder = TrajectoryRecorder(sim, path)
+    for _ in range(3):
+        sim.advance(world_outer_iterations, 1 / world_fps)
+        recorder.record()
+    recorder.close()
+
+    live = Simulation()
+    live.load(scene)
+    window = Window(live)
+    try:
+        window.startPlayback(path)
+        assert not window.timer.isActive()
+        window.reset()
+        assert window.timer.isActive()
+        step = window.sim.step_n
+        runFor(app, 0.3)
+        assert window.sim.step_n > step
+    finally:
+        window.timer.stop()
+        window.stopWorker()
@@ -0,0 +1,16 @@
+import os
+
+from senesim.env import SimulationEnv
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_step_moves_tendon_targets():
+    env = SimulationEnv(os.path.join(root, 'default.yml'), settle_steps=40)
+    env.reset()
+    env.step([1.0, -0.5])
+    a, b = env.actuators
+    assert a.flexor.target == a.flexor.limit
+    assert a.extensor.target == -a.extensor.limit
+    assert b.flexor.target == -0.5 * b.flexor.limit
+    assert b.extensor.target == 0.5 * b.extensor.limit